@@ -102,3 +102,55 @@ plt.xlabel("Time (years)")                       # X-axis label
 plt.ylabel("Fractional accuracy")                # Y-axis label
 plt.grid()                                       # Graph grid
 
+
+# ---
+# ## Exact Propagator
+# 
+# The decay equation is linear in $ N $ with no forcing term, so instead of stepping it can be solved exactly with the propagator $ e^{-\lambda (t - t_{0})} $. The general routine below handles any equation $ \frac {dy}{dt} = Ay + c_{0} + c_{1}t + ... $ by evaluating a matrix exponential at each requested time, so the cost does not depend on how far ahead we look. The coefficients of the decay equation are supplied by hand, $ A = -\lambda $ with no forcing, rather than found from a slope function as in the Euler's technique notebook, since the loop above writes the equation inline.
+
+# In[ ]:
+
+
+# SciPy's matrix exponential works on a whole stack of matrices at once
+from scipy.linalg import expm
+
+# Solve dy/dt = A y + sum(C[k] t^k) exactly at every value in t, given y(t_0) = y_0
+# Returns the y values, with one row per requested t for vector equations
+
+def affine_solve(A, C, y_0, t, t_0=0):
+    
+    A = np.atleast_2d(np.asarray(A, dtype=float))
+    n = len(A)
+    C = np.asarray(C, dtype=float).reshape(-1, n)
+    p = len(C)
+    
+    # Augmented matrix M for the state z = (y, 1, t, t^2, ...)
+    M = np.zeros((n + p, n + p))
+    M[:n, :n] = A
+    M[:n, n:] = C.T
+    for k in range(1, p):
+        M[n + k, n + k - 1] = k                             # d(t^k)/dt = k t^(k-1)
+    
+    z_0 = np.concatenate([np.ravel(y_0).astype(float), float(t_0) ** np.arange(p)])
+    
+    # One matrix exponential per requested t, all evaluated together
+    t = np.asarray(t, dtype=float)
+    Z = expm(M * (t.reshape(-1, 1, 1) - t_0)) @ z_0
+    Y = Z[:, :n].reshape(t.shape + (n,))
+    
+    if np.ndim(y_0) == 0:
+        return Y[..., 0]
+    return Y
+
+
+# In[ ]:
+
+
+# Decay constant of Cobalt-60 in units of per year
+decay_const_exact = np.log(2) / t_half_years
+
+# dN/dt = -lambda N, so A = -lambda and there is no forcing term
+t_exact = np.array([t_year_max, 1e3, 1e9])
+Nc_exact = affine_solve(-decay_const_exact, [0], Nc_0, t_exact)
+for i in range(len(t_exact)):
+    print("t = {0:8.1e} years, Nc = {1:10.4e}".format(t_exact[i], Nc_exact[i]))
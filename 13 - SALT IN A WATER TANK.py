@@ -103,3 +103,52 @@ MAX_i = np.argmax(Q)
 MAX_T = T[MAX_i]
 print("Time at which amount of salt is a maximum is {0:8.2f} minutes".format(MAX_T))
 
+
+# ---
+# ## Exact Propagator
+# 
+# The salt equation $ \frac {dQ}{dt} = Q_{IN} - (\frac {W_{FLOW}}{W_{0}}) Q $ is linear in $ Q $ with a constant forcing term. Rather than stepping it, the routine below solves any equation of the form $ \frac {dy}{dt} = Ay + c_{0} + c_{1}t + ... $ exactly, using one matrix exponential per requested time. The coefficients are supplied by hand, $ A = -\frac {W_{FLOW}}{W_{0}} $ and $ c_{0} = Q_{IN} $, rather than found from a slope function as in the Euler's technique notebook, since the loop above writes the equation inline.
+
+# In[ ]:
+
+
+# SciPy's matrix exponential works on a whole stack of matrices at once
+from scipy.linalg import expm
+
+# Solve dy/dt = A y + sum(C[k] t^k) exactly at every value in t, given y(t_0) = y_0
+# Returns the y values, with one row per requested t for vector equations
+
+def affine_solve(A, C, y_0, t, t_0=0):
+    
+    A = np.atleast_2d(np.asarray(A, dtype=float))
+    n = len(A)
+    C = np.asarray(C, dtype=float).reshape(-1, n)
+    p = len(C)
+    
+    # Augmented matrix M for the state z = (y, 1, t, t^2, ...)
+    M = np.zeros((n + p, n + p))
+    M[:n, :n] = A
+    M[:n, n:] = C.T
+    for k in range(1, p):
+        M[n + k, n + k - 1] = k                             # d(t^k)/dt = k t^(k-1)
+    
+    z_0 = np.concatenate([np.ravel(y_0).astype(float), float(t_0) ** np.arange(p)])
+    
+    # One matrix exponential per requested t, all evaluated together
+    t = np.asarray(t, dtype=float)
+    Z = expm(M * (t.reshape(-1, 1, 1) - t_0)) @ z_0
+    Y = Z[:, :n].reshape(t.shape + (n,))
+    
+    if np.ndim(y_0) == 0:
+        return Y[..., 0]
+    return Y
+
+
+# In[ ]:
+
+
+# A = -W_FLOW/W_0 and the constant forcing term is Q_IN
+T_exact = np.array([T_MAX, 1e4, 1e9])
+Q_exact = affine_solve(-W_FLOW/W_0, [Q_IN], Q_0, T_exact)
+for i in range(len(T_exact)):
+    print("Time = {0:8.1e} minutes, mass of salt = {1:8.4f} kilograms".format(T_exact[i], Q_exact[i]))
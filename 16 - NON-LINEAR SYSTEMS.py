@@ -31,13 +31,14 @@
 # In[3]:
 
 
+import numpy as np
+
 # Function to calculate N generations of the May equation
 # with growth parameter r and initial population X_0
 # Returns an array X containing the populations
 
 def logistic(X_0, r, N):
     
-    import numpy as np
     X = np.zeros(N)
     X[0] = X_0
     
@@ -84,3 +85,211 @@ def main():
     
 main()
 
+
+# ---
+# ## Bifurcation Diagram
+# 
+# To see how the long-term behaviour of the May equation depends on the growth parameter, the map is iterated for a large array of $ r $ values at once. After the transient generations are discarded, every population value is counted into a two-dimensional histogram of $ r $ against $ x $. The histogram has a fixed size, and the $ r $ values are processed in chunks, so the memory used does not depend on the number of $ r $ values or generations.
+# 
+# * Iterate $ X_{i+1} = X_{i}e^{r(1-X_{i})} $ in place for a chunk of $ r $ values
+# * Discard the first n_transient generations
+# * Count the next n_keep generations into the histogram
+
+# In[ ]:
+
+
+# Bifurcation histogram of the May equation for the growth parameters r_values
+# Returns the counts, with shape (r_bins, x_bins), and the r and x bin edges
+
+def bifurcation(r_values, X_0=0.5, n_transient=500, n_keep=1000, r_bins=1000, x_bins=500, x_range=None, chunk=65536, batch=32):
+    
+    r_values = np.asarray(r_values, dtype=float).ravel()
+    r_edges = np.linspace(r_values.min(), r_values.max(), r_bins + 1)
+    if x_range is None:
+        # The largest population the map can produce is exp(r - 1) / r, at X = 1 / r
+        r_top = max(r_values.max(), 1)
+        x_range = (0, np.exp(r_top - 1) / r_top)
+    x_edges = np.linspace(x_range[0], x_range[1], x_bins + 1)
+    x_scale = x_bins / (x_range[1] - x_range[0])
+    
+    # One extra bin collects the populations outside x_range
+    counts = np.zeros(r_bins * x_bins + 1, dtype=np.int64)
+    
+    for start in range(0, len(r_values), chunk):
+        r = r_values[start:start + chunk]
+        row = np.minimum(np.searchsorted(r_edges, r, side="right") - 1, r_bins - 1) * x_bins
+        X = np.full(len(r), float(X_0))
+        tmp = np.empty_like(X)
+        idx = np.empty((batch, len(r)), dtype=np.int64)
+        
+        with np.errstate(over="ignore", under="ignore"):
+            for i in range(n_transient + n_keep):
+                # X = X exp(r (1 - X)), without temporary arrays
+                np.subtract(1, X, out=tmp)
+                tmp *= r
+                np.exp(tmp, out=tmp)
+                X *= tmp
+                
+                if i >= n_transient:
+                    # Histogram bin of each population; a batch of generations is counted at once
+                    k = (i - n_transient) % batch
+                    np.subtract(X, x_range[0], out=tmp)
+                    tmp *= x_scale
+                    outside = ~((tmp >= 0) & (tmp < x_bins))
+                    tmp[outside] = 0
+                    idx[k] = tmp
+                    idx[k] += row
+                    idx[k][outside] = r_bins * x_bins
+                    if k == batch - 1 or i == n_transient + n_keep - 1:
+                        counts += np.bincount(idx[:k + 1].ravel(), minlength=len(counts))
+    
+    return counts[:-1].reshape(r_bins, x_bins), r_edges, x_edges
+
+
+# In[ ]:
+
+
+import time
+import matplotlib.pyplot as plt
+
+start = time.perf_counter()
+hist, r_edges, x_edges = bifurcation(np.linspace(1.5, 4.0, 100000), n_transient=300, n_keep=300, r_bins=800, x_bins=600, x_range=(0, 5))
+print("Bifurcation diagram of 100,000 r values in {0:5.2f} seconds".format(time.perf_counter() - start))
+
+# Plot the logarithm of the counts, with r along the x-axis
+plt.imshow(np.log1p(hist.T), origin="lower", aspect="auto", cmap="binary",
+           extent=[r_edges[0], r_edges[-1], x_edges[0], x_edges[-1]])
+plt.xlabel("Growth parameter r")
+plt.ylabel("Population $x$")
+plt.title("May Equation - Bifurcation Diagram")
+plt.show()
+
+# ---
+# ## Lyapunov Exponents and Predictability
+# 
+# `main()` finds the generation at which two populations diverge by $ 20 \% $ for one pair of starting values and one value of $ r $. The same question can be asked for a whole grid of growth parameters, initial populations and perturbation sizes at once. Alongside it, the Lyapunov exponent measures the average rate at which neighbouring populations separate, using the derivative of the May equation:
+# $$ \lambda = \frac {1}{N} \sum_{i=0}^{N-1} \ln |f'(x_{i})| \qquad \ln |f'(x)| = r(1 - x) + \ln |1 - rx| $$
+# A positive $ \lambda $ means the populations are chaotic.
+# 
+# Every grid point is iterated together. Once a pair has diverged it is dropped from the perturbed population, so the arrays shrink as the pairs diverge.
+
+# In[ ]:
+
+
+# Lyapunov exponent over N generations, and the first generation at which the populations starting
+# at X_0 and X_0 + perturbation differ by threshold (as a fraction of the first), or -1 if they never do
+# r, X_0 and perturbation are broadcast together, and the results have their broadcast shape
+
+def predictability(r, X_0, perturbation, N=50, threshold=0.2):
+    
+    r, X_0, perturbation = np.broadcast_arrays(np.asarray(r, dtype=float), np.asarray(X_0, dtype=float), np.asarray(perturbation, dtype=float))
+    shape = r.shape
+    r = r.ravel()
+    X1 = X_0.ravel().copy()
+    
+    lyapunov = np.zeros(len(r))
+    generation = np.full(len(r), -1)
+    active = np.arange(len(r))                   # Pairs which have not diverged yet
+    X2 = X1 + perturbation.ravel()
+    
+    with np.errstate(divide="ignore", over="ignore", under="ignore"):
+        for i in range(N):
+            # Drop the pairs which have diverged by generation i
+            diverged = np.abs((X1[active] - X2) / X1[active]) >= threshold
+            generation[active[diverged]] = i
+            active = active[~diverged]
+            X2 = X2[~diverged]
+            
+            # Add ln|f'(x_i)| and move both populations on a generation
+            lyapunov += r*(1 - X1) + np.log(np.abs(1 - r*X1))
+            X1 = X1 * np.exp(r*(1 - X1))
+            X2 = X2 * np.exp(r[active]*(1 - X2))
+    
+    return (lyapunov / N).reshape(shape), generation.reshape(shape)
+
+
+# In[ ]:
+
+
+# The pair from main() gives the same answer
+lyap, gen = predictability(3.0, 2.00000, 0.00001)
+print("r = 3.0: Lyapunov exponent = {0:6.3f}, populations diverge by 20% after {1} generations".format(lyap, gen))
+
+# Grid of 500 growth parameters and 7 perturbation sizes, all starting at X_0 = 0.5
+r_grid = np.linspace(1.5, 4.0, 500)
+eps_grid = np.logspace(-9, -3, 7)
+lyap, gen = predictability(r_grid[:, None], 0.5, eps_grid[None, :], N=1000)
+
+plt.plot(r_grid, lyap[:, 0])
+plt.axhline(0, color="k", linewidth=0.5)
+plt.xlabel("Growth parameter r")
+plt.ylabel("Lyapunov exponent $\\lambda$")
+plt.title("May Equation - Lyapunov Exponent")
+plt.grid()
+plt.show()
+
+for j in range(len(eps_grid)):
+    plt.plot(r_grid, np.where(gen[:, j] >= 0, gen[:, j], np.nan), ".", markersize=2, label="{0:.0e}".format(eps_grid[j]))
+plt.xlabel("Growth parameter r")
+plt.ylabel("Generations until 20% divergence")
+plt.title("May Equation - Predictability Horizon")
+plt.legend(title="Perturbation")
+plt.grid()
+plt.show()
+
+
+# ---
+# ## Cycle Detection
+# 
+# For many values of $ r $ the populations settle onto a fixed point or a short cycle, and iterating all $ N $ generations is wasted work. `logistic_cycle()` calculates the same populations as `logistic()`, but stops as soon as a population repeats an earlier one to within a tolerance, fills the rest of the array by repeating the cycle, and reports its period.
+
+# In[ ]:
+
+
+# Function to calculate N generations of the May equation like logistic(),
+# stopping once the populations repeat to within tol (Brent's cycle detection)
+# Returns the array X, with the rest filled by repeating the cycle, the period and the cycle
+# (a period of 0 and an empty cycle if no repetition is found)
+
+def logistic_cycle(X_0, r, N, tol=1e-12):
+    
+    X = np.zeros(N)
+    X[0] = X_0
+    
+    # The tortoise waits at generation t while the hare moves on; the tortoise jumps
+    # to the hare each time the distance between them reaches the next power of two
+    t = 0
+    power = 1
+    for i in range(N - 1):
+        X[i+1] = X[i] * np.exp(r*(1 - X[i]))
+        if abs(X[i+1] - X[t]) <= tol:
+            period = i + 1 - t
+            cycle = X[t+1:i+2].copy()
+            X[i+2:] = np.resize(cycle, N - i - 2)
+            return X, period, cycle
+        if i + 1 - t == power:
+            t = i + 1
+            power *= 2
+    
+    return X, 0, np.zeros(0)
+
+
+# In[ ]:
+
+
+# Period of the attractor for a range of growth parameters, and the time saved in a long scan
+N_long = 100000
+for r_cycle in [1.5, 2.2, 2.6, 2.68, 3.0]:
+    X_cycle, period, cycle = logistic_cycle(0.5, r_cycle, N_long, tol=1e-12)
+    print("r = {0:4.2f}: period = {1}, attractor = {2}".format(r_cycle, period, np.round(cycle, 4)))
+
+start = time.perf_counter()
+for r_cycle in np.linspace(1.5, 2.5, 20):
+    logistic(0.5, r_cycle, N_long)
+time_full = time.perf_counter() - start
+
+start = time.perf_counter()
+for r_cycle in np.linspace(1.5, 2.5, 20):
+    logistic_cycle(0.5, r_cycle, N_long, tol=1e-12)
+time_cycle = time.perf_counter() - start
+print("Scan of 20 stable r values: {0:6.3f} s without cycle detection, {1:6.3f} s with".format(time_full, time_cycle))
@@ -247,3 +247,656 @@ plt.show()
 # Determine the orbital period of Eris
 print("The orbital period of Eris is:", np.argmax(KE_per_m), "years.")
 
+
+# ---
+# 
+# Symplectic Integration with Adaptive Time Steps
+# ---
+# 
+# The Euler-Cromer technique with $ \Delta t = 1 $ year is far too coarse near perihelion, where Eris moves fastest, and needlessly fine near aphelion. The velocity Verlet (leapfrog) technique is symplectic and time-reversible, so the energy error stays bounded instead of drifting. Each step is a half kick, a drift and another half kick:
+# 
+# $$ v_{n + \frac{1}{2}} = v_{n} + \frac {h}{2} a(x_{n}) \qquad x_{n + 1} = x_{n} + h v_{n + \frac{1}{2}} \qquad v_{n + 1} = v_{n + \frac{1}{2}} + \frac {h}{2} a(x_{n + 1}) $$
+# 
+# Three Verlet steps of sizes $ w_{1}h $, $ w_{0}h $, $ w_{1}h $, with $ w_{1} = \frac {1}{2 - 2^{1/3}} $ and $ w_{0} = 1 - 2w_{1} $, make up Yoshida's fourth order technique.
+# 
+# The step size follows the orbital time scale, $ \tau = \eta \sqrt{r^{3}/GM} $. To keep the technique time-reversible, each step uses the average of $ \tau $ at its start and its end, $ h = \frac {1}{2}(\tau_{n} + \tau_{n + 1}) $, found without extra force evaluations by predicting the end of the step from $ x_{n} + h v_{n} + \frac{h^{2}}{2} a_{n} $. The step is then taken once, and repeated only if $ \tau $ at its actual end changes $ h $ by more than a small tolerance. The cost of each technique is counted in force evaluations, since Yoshida's step needs three.
+# 
+# ---
+
+# In[ ]:
+
+
+# Acceleration of Eris at position pos = (x, y) due to the Sun at the origin
+def gravity(pos):
+    return - GM * pos / np.sum(pos**2)**(3/2)
+
+
+# Velocity Verlet step of size h; acc is the acceleration at pos
+# Returns the position, velocity and acceleration at the end of the step
+def verlet_step(pos, vel, acc, h):
+    vel = vel + acc * h/2        # Half kick
+    pos = pos + vel * h          # Drift
+    acc = gravity(pos)
+    vel = vel + acc * h/2        # Half kick
+    return pos, vel, acc
+
+
+# Yoshida's fourth order step, made of three Verlet steps
+YOSHIDA_W1 = 1 / (2 - 2**(1/3))
+YOSHIDA_W0 = 1 - 2 * YOSHIDA_W1
+
+def yoshida_step(pos, vel, acc, h):
+    pos, vel, acc = verlet_step(pos, vel, acc, YOSHIDA_W1 * h)
+    pos, vel, acc = verlet_step(pos, vel, acc, YOSHIDA_W0 * h)
+    pos, vel, acc = verlet_step(pos, vel, acc, YOSHIDA_W1 * h)
+    return pos, vel, acc
+
+
+# Euler-Cromer step of size h, as used in the loop above
+def euler_cromer_step(pos, vel, acc, h):
+    vel = vel + acc * h
+    pos = pos + vel * h
+    return pos, vel, gravity(pos)
+
+
+SYMPLECTIC_STEPS = {"euler_cromer": euler_cromer_step, "verlet": verlet_step, "yoshida": yoshida_step}
+STEP_EVALUATIONS = {"euler_cromer": 1, "verlet": 1, "yoshida": 3}      # Calls of gravity() per step
+
+
+# Orbital time scale at position pos
+def orbit_time_scale(pos):
+    return np.sum(pos**2)**(3/4) / np.sqrt(GM)
+
+
+# Step the orbit from pos_0 = (x, y), vel_0 = (v_x, v_y) up to t_max with a symplectic technique
+# With delta_t the step is fixed; with eta the step is eta times the orbital time scale,
+# made time-symmetric by averaging over both ends of the step to within h_tol
+# Yields t, pos and vel at the start and after every step
+# If stats is a dictionary, the number of gravity() calls is kept in stats["evaluations"]
+
+def orbit_steps(pos_0, vel_0, t_max, delta_t=None, eta=None, method="verlet", iterations=2, h_tol=1e-3, stats=None):
+    
+    step = SYMPLECTIC_STEPS[method]
+    cost = STEP_EVALUATIONS[method]
+    pos = np.array(pos_0, dtype=float)
+    vel = np.array(vel_0, dtype=float)
+    acc = gravity(pos)
+    evaluations = 1
+    t = 0.0
+    yield t, pos, vel
+    
+    while t < t_max:
+        if eta is None:
+            h = min(delta_t, t_max - t)
+            pos, vel, acc = step(pos, vel, acc, h)
+            evaluations += cost
+        else:
+            # Predict the end of the step from a Taylor expansion, which needs no new forces
+            tau_start = eta * orbit_time_scale(pos)
+            h = tau_start
+            for i in range(iterations):
+                h = (tau_start + eta * orbit_time_scale(pos + vel*h + acc*h**2/2)) / 2
+            
+            # Take the step, and repeat it only if h is not yet the average of both ends
+            for i in range(iterations + 1):
+                h = min(h, t_max - t)
+                pos_end, vel_end, acc_end = step(pos, vel, acc, h)
+                evaluations += cost
+                h_new = (tau_start + eta * orbit_time_scale(pos_end)) / 2
+                if abs(h_new - h) <= h_tol * h or h == t_max - t:
+                    break
+                h = h_new
+            pos, vel, acc = pos_end, vel_end, acc_end
+        
+        t = t + h
+        if stats is not None:
+            stats["evaluations"] = evaluations
+        yield t, pos, vel
+
+
+# Integrate the orbit with orbit_steps, keeping every step
+# Returns arrays of t, x, y, v_x and v_y
+
+def orbit_symplectic(pos_0, vel_0, t_max, delta_t=None, eta=None, method="verlet", iterations=2, h_tol=1e-3, stats=None):
+    
+    t_list, pos_list, vel_list = [], [], []
+    for t, pos, vel in orbit_steps(pos_0, vel_0, t_max, delta_t, eta, method, iterations, h_tol, stats):
+        t_list.append(t)
+        pos_list.append(pos)
+        vel_list.append(vel)
+    
+    pos_array = np.array(pos_list)
+    vel_array = np.array(vel_list)
+    return np.array(t_list), pos_array[:, 0], pos_array[:, 1], vel_array[:, 0], vel_array[:, 1]
+
+
+# In[ ]:
+
+
+# Compare the energy error and the perihelion distance over the later orbits with the Euler-Cromer result,
+# along with the number of steps and the number of force evaluations they cost
+def orbit_summary(name, evaluations, t_s, x_s, y_s, v_x_s, v_y_s):
+    r_s = (x_s**2 + y_s**2) ** (1/2)
+    TE_s = (1/2) * ((v_x_s**2) + (v_y_s**2)) - GM / r_s
+    TE_err = np.max(np.abs((TE_s - TE_s[0]) / TE_s[0]))
+    r_peri = r_s[t_s > t_max/2].min()
+    print("{0:>28}: steps = {1:6}, forces = {2:6}, max |dE/E| = {3:9.2e}, perihelion (2nd orbit) = {4:7.3f} AU".format(name, len(t_s) - 1, evaluations, TE_err, r_peri))
+
+def orbit_compare(name, **kwargs):
+    stats = {}
+    result = orbit_symplectic([x[0], y[0]], [v_x[0], v_y[0]], t_max, stats=stats, **kwargs)
+    orbit_summary(name, stats["evaluations"], *result)
+
+orbit_summary("Euler-Cromer, dt = 1 yr", N, t, x, y, v_x, v_y)
+orbit_compare("Verlet, dt = 1 yr", delta_t=1)
+orbit_compare("Verlet, dt = 0.25 yr", delta_t=0.25)
+orbit_compare("Verlet, adaptive", eta=0.02)
+orbit_compare("Yoshida, adaptive", eta=0.05, method="yoshida")
+
+# ---
+# 
+# N-Body Integration
+# ---
+# 
+# The Eris model above has one body moving around a Sun fixed at the origin. To follow the Sun, the giant planets and thousands of trans-Neptunian objects together, positions and velocities are held in arrays of shape $ (N, 3) $, in units of AU, years and solar masses, so that $ G = 4 \pi^{2} $. The acceleration of body $ i $ is
+# 
+# $$ a_{i} = G \sum_{j \neq i} \frac {m_{j} (x_{j} - x_{i})} {(|x_{j} - x_{i}|^{2} + \epsilon^{2})^{3/2}} $$
+# 
+# where $ \epsilon $ is an optional softening length.
+# 
+# * The massive bodies attract each other, calculated for all pairs at once
+# * The trans-Neptunian objects are test particles: they feel the massive bodies but have no effect on them, so their cost grows only in proportion to their number
+# * For a large number of massive bodies, a Barnes-Hut tree groups distant bodies into cells, which are treated as single masses at their centre of mass when the cell size divided by the distance is less than $ \theta $
+# 
+# The bodies are advanced with the velocity Verlet (kick-drift-kick) technique.
+# 
+# ---
+
+# In[ ]:
+
+
+# Acceleration of each of the massive bodies at pos, shape (N, 3), due to all the others
+def nbody_accel(pos, mass, G=GM, soft=0):
+    d = pos[None, :, :] - pos[:, None, :]          # d[i, j] = pos[j] - pos[i]
+    r2 = np.sum(d**2, axis=2) + soft**2
+    np.fill_diagonal(r2, np.inf)                   # No force of a body on itself
+    return G * np.einsum("ij,ijk->ik", mass / r2**(3/2), d)
+
+
+# Acceleration of test particles at points, shape (P, 3), due to massive bodies at pos
+def test_particle_accel(points, pos, mass, G=GM, soft=0):
+    acc = np.zeros_like(points)
+    for j in range(len(pos)):
+        d = pos[j] - points
+        acc += G * mass[j] * d / (np.sum(d**2, axis=1) + soft**2)[:, None]**(3/2)
+    return acc
+
+
+# Build a Barnes-Hut octree of the bodies at pos
+# Returns the centre of mass, mass and size of each cell, and the indices of its
+# 8 sub-cells (-1 where there is none); cell 0 is the root
+def bh_tree(pos, mass):
+    
+    com, cell_mass, size, children = [], [], [], []
+    octants = np.array([[(o >> k) & 1 for k in range(3)] for o in range(8)])
+    
+    def build(idx, centre, half):
+        cell = len(cell_mass)
+        m = mass[idx].sum()
+        cell_mass.append(m)
+        if len(idx) == 1:
+            com.append(pos[idx[0]])                # Exactly at the body, so it feels no force from itself
+        else:
+            com.append(mass[idx] @ pos[idx] / m if m > 0 else pos[idx].mean(axis=0))
+        size.append(2 * half)
+        children.append([-1] * 8)
+        # Split cells holding more than one body, unless the bodies are at the same place
+        if len(idx) > 1 and half > 1e-12 * (1 + np.abs(centre).max()):
+            octant = (pos[idx] > centre) @ np.array([1, 2, 4])
+            for o in range(8):
+                sub = idx[octant == o]
+                if len(sub):
+                    children[cell][o] = build(sub, centre + (octants[o] - 1/2) * half, half/2)
+        return cell
+    
+    low, high = pos.min(axis=0), pos.max(axis=0)
+    build(np.arange(len(pos)), (low + high)/2, max((high - low).max()/2, 1e-12) * (1 + 1e-9))
+    return np.array(com), np.array(cell_mass), np.array(size), np.array(children)
+
+
+# Acceleration at points, shape (P, 3), from a Barnes-Hut tree
+# All (point, cell) pairs are handled together; a cell is used as a single mass if it has no
+# sub-cells or if size < theta * distance, otherwise the pair is replaced by its sub-cells
+def tree_accel(points, tree, G=GM, theta=0.5, soft=0):
+    
+    com, cell_mass, size, children = tree
+    leaf = (children < 0).all(axis=1)
+    acc = np.zeros_like(points)
+    target = np.arange(len(points))
+    cell = np.zeros(len(points), dtype=int)
+    
+    while len(target):
+        d = com[cell] - points[target]
+        r2 = np.sum(d**2, axis=1) + soft**2
+        accept = leaf[cell] | (size[cell]**2 < theta**2 * r2)
+        
+        # A body has no force on itself: its own leaf is at zero distance
+        a = d[accept] * (G * cell_mass[cell[accept]] / np.where(r2[accept] > 0, r2[accept], np.inf)**(3/2))[:, None]
+        for k in range(3):
+            acc[:, k] += np.bincount(target[accept], weights=a[:, k], minlength=len(points))
+        
+        # Open the remaining cells
+        sub = children[cell[~accept]].ravel()
+        target = np.repeat(target[~accept], 8)[sub >= 0]
+        cell = sub[sub >= 0]
+    
+    return acc
+
+
+# Advance massive bodies (pos, vel, mass) and test particles (pos_test, vel_test) by n_steps
+# velocity Verlet steps of delta_t; with theta the massive bodies use a Barnes-Hut tree
+# Returns the final pos, vel, pos_test and vel_test
+
+def nbody_leapfrog(pos, vel, mass, pos_test, vel_test, delta_t, n_steps, theta=None, soft=0, G=GM):
+    
+    pos, vel = np.array(pos, dtype=float), np.array(vel, dtype=float)
+    pos_test, vel_test = np.array(pos_test, dtype=float), np.array(vel_test, dtype=float)
+    
+    def accelerations(pos, pos_test):
+        if theta is None:
+            return nbody_accel(pos, mass, G, soft), test_particle_accel(pos_test, pos, mass, G, soft)
+        tree = bh_tree(pos, mass)
+        return tree_accel(pos, tree, G, theta, soft), tree_accel(pos_test, tree, G, theta, soft)
+    
+    acc, acc_test = accelerations(pos, pos_test)
+    for i in range(n_steps):
+        vel += acc * delta_t/2                    # Half kick
+        vel_test += acc_test * delta_t/2
+        pos += vel * delta_t                      # Drift
+        pos_test += vel_test * delta_t
+        acc, acc_test = accelerations(pos, pos_test)
+        vel += acc * delta_t/2                    # Half kick
+        vel_test += acc_test * delta_t/2
+    
+    return pos, vel, pos_test, vel_test
+
+
+# In[ ]:
+
+
+# The Sun and the giant planets on circular orbits, with masses in solar masses
+rng = np.random.default_rng(0)
+planet_a = np.array([0, 5.203, 9.537, 19.19, 30.07])                 # Sun, Jupiter, Saturn, Uranus, Neptune (AU)
+planet_m = np.array([1, 9.546e-4, 2.858e-4, 4.366e-5, 5.151e-5])
+phase = rng.uniform(0, 2*np.pi, len(planet_a))
+planet_pos = planet_a[:, None] * np.column_stack([np.cos(phase), np.sin(phase), np.zeros(len(phase))])
+planet_vel = np.sqrt(GM / np.maximum(planet_a, 1e-9))[:, None] * np.column_stack([-np.sin(phase), np.cos(phase), np.zeros(len(phase))])
+planet_vel[0] = - planet_m[1:] @ planet_vel[1:]                       # No net momentum
+
+# Eris and 2000 trans-Neptunian objects between 35 and 50 AU as test particles
+n_tno = 2000
+tno_a = rng.uniform(35, 50, n_tno)
+tno_phase = rng.uniform(0, 2*np.pi, n_tno)
+tno_pos = np.vstack([[x[0], y[0], 0], tno_a[:, None] * np.column_stack([np.cos(tno_phase), np.sin(tno_phase), np.zeros(n_tno)])])
+tno_vel = np.vstack([[v_x[0], v_y[0], 0], np.sqrt(GM / tno_a)[:, None] * np.column_stack([-np.sin(tno_phase), np.cos(tno_phase), np.zeros(n_tno)])])
+
+pos_end, vel_end, tno_pos_end, tno_vel_end = nbody_leapfrog(planet_pos, planet_vel, planet_m, tno_pos, tno_vel, 0.1, 1000)
+
+plt.figure(figsize=(6,6))
+plt.plot(tno_pos_end[1:, 0], tno_pos_end[1:, 1], "k,", label="TNOs")
+plt.plot(pos_end[:, 0], pos_end[:, 1], "ro", label="Sun and giant planets")
+plt.plot(tno_pos_end[0, 0], tno_pos_end[0, 1], "bo", label="Eris")
+plt.title("Outer Solar System after 100 years")
+plt.xlabel("x (AU)")
+plt.ylabel("y (AU)")
+plt.legend()
+plt.grid()
+plt.show()
+
+
+# In[ ]:
+
+
+# Check the Barnes-Hut tree against the direct sum for a cluster of 2000 massive bodies
+cluster_pos = rng.standard_normal((2000, 3))
+cluster_m = np.full(2000, 1/2000)
+acc_direct = nbody_accel(cluster_pos, cluster_m, soft=0.01)
+acc_tree = tree_accel(cluster_pos, bh_tree(cluster_pos, cluster_m), theta=0.5, soft=0.01)
+acc_err = np.sqrt(np.sum((acc_tree - acc_direct)**2, axis=1) / np.sum(acc_direct**2, axis=1))
+print("Barnes-Hut, theta = 0.5: median relative error in acceleration = {0:8.2e}".format(np.median(acc_err)))
+
+
+# ---
+# 
+# Perihelion, Aphelion and Orbital Period from Events
+# ---
+# 
+# Reading the period from `np.argmax(KE_per_m)` and the aphelion from `abs(x.min())` is only as accurate as the step size, and needs the whole history of the orbit. Instead, the perihelion and aphelion can be found as the orbit is integrated, from the radial velocity
+# 
+# $$ v_{r} = \frac {x v_{x} + y v_{y}} {r} $$
+# 
+# which changes from negative to positive at perihelion and from positive to negative at aphelion. Within a step where $ v_{r} $ changes sign, $ r(t) $ is interpolated with the cubic Hermite polynomial through $ r $ and $ v_{r} $ at both ends of the step, and the turning point is where its derivative, a quadratic, is zero. Only the previous step and the list of events are kept.
+# 
+# ---
+
+# In[ ]:
+
+
+# Find the perihelia and aphelia of the orbit stepped by orbit_steps, as it is integrated
+# Returns arrays of (t, r) for the perihelia and the aphelia, and the orbital period
+# from the mean time between successive perihelia (or aphelia, if there are more)
+
+def orbit_apsides(pos_0, vel_0, t_max, delta_t=None, eta=None, method="verlet", iterations=2):
+    
+    perihelia = []
+    aphelia = []
+    t_prev = None
+    
+    for t_now, pos, vel in orbit_steps(pos_0, vel_0, t_max, delta_t, eta, method, iterations):
+        r_now = np.sqrt(np.sum(pos**2))
+        v_r_now = np.sum(pos * vel) / r_now
+        
+        if t_prev is not None and (v_r_prev < 0) != (v_r_now < 0):
+            # Derivative of the Hermite polynomial for r over the step, as a quadratic in theta
+            h = t_now - t_prev
+            A = 6*r_prev + 3*h*v_r_prev - 6*r_now + 3*h*v_r_now
+            B = -6*r_prev - 4*h*v_r_prev + 6*r_now - 2*h*v_r_now
+            C = h*v_r_prev
+            roots = np.roots([A, B, C])
+            roots = roots[np.isreal(roots)].real
+            theta = np.clip(roots[np.argmin(np.abs(roots - 1/2))], 0, 1)   # The root within the step
+            
+            # Value of the Hermite polynomial at the turning point
+            r_turn = ((2*theta - 3)*theta**2 + 1)*r_prev + ((theta - 2)*theta + 1)*theta*h*v_r_prev \
+                     + (3 - 2*theta)*theta**2*r_now + (theta - 1)*theta**2*h*v_r_now
+            event = (t_prev + theta*h, r_turn)
+            if v_r_prev < 0:
+                perihelia.append(event)
+            else:
+                aphelia.append(event)
+        
+        t_prev, r_prev, v_r_prev = t_now, r_now, v_r_now
+    
+    perihelia = np.array(perihelia).reshape(-1, 2)
+    aphelia = np.array(aphelia).reshape(-1, 2)
+    times = perihelia[:, 0] if len(perihelia) >= len(aphelia) else aphelia[:, 0]
+    period = np.mean(np.diff(times)) if len(times) > 1 else np.nan
+    return perihelia, aphelia, period
+
+
+# In[ ]:
+
+
+# Exact values for the two-body orbit, from the energy and the starting distance
+a_exact = 1 / (2/x[0] - v_y[0]**2/GM)             # Semi-major axis (AU)
+print("Exact: perihelion = {0:7.3f} AU, aphelion = {1:7.3f} AU, period = {2:7.2f} years".format(x[0], 2*a_exact - x[0], a_exact**(3/2)))
+
+for name, options in [("Euler-Cromer, dt = 1 yr", {"delta_t": 1, "method": "euler_cromer"}),
+                      ("Yoshida, adaptive", {"eta": 0.05, "method": "yoshida"})]:
+    perihelia, aphelia, period = orbit_apsides([x[0], y[0]], [v_x[0], v_y[0]], 2*t_max, **options)
+    print("{0:>23}: perihelion = {1:7.3f} AU, aphelion = {2:7.3f} AU, period = {3:7.2f} years".format(name, perihelia[:, 1].mean(), aphelia[:, 1].mean(), period))
+
+# ---
+# 
+# Kepler Propagator
+# ---
+# 
+# For two bodies, such as Eris and the Sun, the orbit can be found in closed form at any time, so no stepping is needed. The universal variable formulation works for elliptical, parabolic and hyperbolic orbits alike. With $ r_{0} $, $ v_{r0} $ the starting distance and radial velocity, and $ \alpha = \frac {2}{r_{0}} - \frac {v_{0}^{2}}{GM} = \frac {1}{a} $, the universal anomaly $ \chi $ at a time $ \Delta t $ later solves Kepler's equation
+# 
+# $$ \frac {r_{0} v_{r0}}{\sqrt{GM}} \chi^{2} C(z) + (1 - \alpha r_{0}) \chi^{3} S(z) + r_{0} \chi = \sqrt{GM} \Delta t \qquad z = \alpha \chi^{2} $$
+# 
+# where $ C $ and $ S $ are the Stumpff functions. It is solved with Newton's method for all bodies and all times at once, and the state follows from the Lagrange coefficients:
+# 
+# $$ \vec r = f \vec r_{0} + g \vec v_{0} \qquad \vec v = \dot f \vec r_{0} + \dot g \vec v_{0} $$
+# 
+# For elliptical orbits $ \Delta t $ is first reduced to less than one period, so distant times cost no more than near ones. With no steps there is no energy drift, which makes this a reference for the numerical techniques above.
+# 
+# ---
+
+# In[ ]:
+
+
+# Stumpff functions C(z) and S(z), using their series near z = 0
+def stumpff(z):
+    C = np.empty_like(z)
+    S = np.empty_like(z)
+    pos = z > 1e-3
+    neg = z < -1e-3
+    small = ~(pos | neg)
+    
+    sz = np.sqrt(z[pos])
+    C[pos] = (1 - np.cos(sz)) / z[pos]
+    S[pos] = (sz - np.sin(sz)) / sz**3
+    sz = np.sqrt(-z[neg])
+    C[neg] = (np.cosh(sz) - 1) / -z[neg]
+    S[neg] = (np.sinh(sz) - sz) / sz**3
+    zs = z[small]
+    C[small] = 1/2 - zs/24 + zs**2/720 - zs**3/40320
+    S[small] = 1/6 - zs/120 + zs**2/5040 - zs**3/362880
+    return C, S
+
+
+# Semi-major axis, eccentricity, inclination (degrees) and period of orbits starting
+# at positions r_0 with velocities v_0, each of shape (N, 3) or (3,)
+def orbital_elements(r_0, v_0, GM=GM):
+    r_0, v_0 = np.asarray(r_0, dtype=float), np.asarray(v_0, dtype=float)
+    r0 = np.sqrt(np.sum(r_0**2, axis=-1))
+    alpha = 2/r0 - np.sum(v_0**2, axis=-1)/GM                 # 1 / semi-major axis
+    with np.errstate(divide="ignore"):                       # a is infinite for a parabolic orbit
+        a = 1 / alpha
+    h = np.cross(r_0, v_0)
+    e_vec = np.cross(v_0, h)/GM - r_0/r0[..., None]
+    e = np.sqrt(np.sum(e_vec**2, axis=-1))
+    inc = np.degrees(np.arccos(h[..., 2] / np.sqrt(np.sum(h**2, axis=-1))))
+    ellipse = alpha > 0
+    period = np.where(ellipse, 2*np.pi / np.sqrt(GM * np.where(ellipse, alpha, 1)**3), np.inf)
+    return a, e, inc, period
+
+
+# Positions and velocities at times t of bodies which were at r_0 with velocity v_0 at time 0,
+# each of shape (N, 3) or (3,), moving around a mass GM at the origin
+# Returns r and v with shape (len(t), N, 3), or (len(t), 3) for a single body
+
+def kepler_propagate(r_0, v_0, t, GM=GM, tol=1e-12, max_iter=50):
+    
+    single = np.ndim(r_0) == 1
+    r_0 = np.atleast_2d(np.asarray(r_0, dtype=float))
+    v_0 = np.atleast_2d(np.asarray(v_0, dtype=float))
+    sqmu = np.sqrt(GM)
+    
+    r0 = np.sqrt(np.sum(r_0**2, axis=1))
+    vr0 = np.sum(r_0 * v_0, axis=1) / r0                    # Radial velocity
+    alpha = 2/r0 - np.sum(v_0**2, axis=1)/GM                 # 1 / semi-major axis
+    
+    # Times for every body, reduced to within one period for elliptical orbits
+    dt = np.broadcast_to(np.atleast_1d(np.asarray(t, dtype=float))[:, None], (np.size(t), len(r0))).copy()
+    ellipse = alpha > 0
+    period = 2*np.pi / np.sqrt(GM * alpha[ellipse]**3)
+    dt[:, ellipse] = np.remainder(dt[:, ellipse], period)
+    
+    # Starting guesses for the universal anomaly chi: elliptical orbits from the mean motion,
+    # hyperbolic orbits from the logarithmic guess of the hyperbolic anomaly
+    chi = np.where(ellipse, sqmu * np.abs(alpha) * dt, sqmu * dt / r0)
+    hyperbola = alpha < -1e-12
+    if hyperbola.any():
+        a_h = 1 / alpha[hyperbola]
+        sign = np.sign(dt[:, hyperbola])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            chi_h = sign * np.sqrt(-a_h) * np.log(-2 * GM * alpha[hyperbola] * dt[:, hyperbola]
+                        / (r0[hyperbola] * vr0[hyperbola] + sign * np.sqrt(-GM * a_h) * (1 - r0[hyperbola] * alpha[hyperbola])))
+        chi[:, hyperbola] = np.where(np.isfinite(chi_h), chi_h, chi[:, hyperbola])
+    
+    # Newton's method for chi
+    for i in range(max_iter):
+        z = alpha * chi**2
+        C, S = stumpff(z)
+        F = r0*vr0/sqmu * chi**2 * C + (1 - alpha*r0) * chi**3 * S + r0*chi - sqmu*dt
+        dF = r0*vr0/sqmu * chi * (1 - z*S) + (1 - alpha*r0) * chi**2 * C + r0
+        change = F / dF
+        chi = chi - change
+        if np.all(np.abs(change) <= tol * np.maximum(1, np.abs(chi))):
+            break
+    else:
+        raise RuntimeError("Kepler's equation did not converge in {0} iterations".format(max_iter))
+    
+    # Lagrange coefficients
+    z = alpha * chi**2
+    C, S = stumpff(z)
+    f = 1 - chi**2 / r0 * C
+    g = dt - chi**3 * S / sqmu
+    r = f[..., None] * r_0 + g[..., None] * v_0
+    rn = np.sqrt(np.sum(r**2, axis=2))
+    f_dot = sqmu / (rn * r0) * (alpha * chi**3 * S - chi)
+    g_dot = 1 - chi**2 * C / rn
+    v = f_dot[..., None] * r_0 + g_dot[..., None] * v_0
+    
+    if single:
+        return r[:, 0], v[:, 0]
+    return r, v
+
+
+# Read a catalogue of bodies, one per line as x, y, z, v_x, v_y, v_z (AU, AU per yr)
+# Returns the arrays of positions and velocities, each of shape (N, 3)
+def load_catalogue(filename):
+    data = np.loadtxt(filename, delimiter=",", ndmin=2)
+    return data[:, :3], data[:, 3:6]
+
+
+# In[ ]:
+
+
+# Eris: elements, and the state at every year of the Euler-Cromer run from one batched evaluation
+a_eris, e_eris, inc_eris, period_eris = orbital_elements([x[0], y[0], 0], [v_x[0], v_y[0], 0])
+print("Eris: a = {0:7.3f} AU, e = {1:6.4f}, period = {2:7.2f} years".format(a_eris, e_eris, period_eris))
+
+r_kepler, v_kepler = kepler_propagate([x[0], y[0], 0], [v_x[0], v_y[0], 0], t)
+print("Largest distance between Euler-Cromer and Kepler positions: {0:7.3f} AU".format(np.max(np.sqrt((x - r_kepler[:, 0])**2 + (y - r_kepler[:, 1])**2))))
+
+# After a million years the Kepler energy is unchanged
+r_far, v_far = kepler_propagate([x[0], y[0], 0], [v_x[0], v_y[0], 0], [1e6])
+TE_far = (1/2) * np.sum(v_far**2) - GM / np.sqrt(np.sum(r_far**2))
+print("Fractional energy change after 10^6 years: {0:9.2e}".format((TE_far - TE[0]) / TE[0]))
+
+# All of the trans-Neptunian objects, at 100 times, in one call
+r_tno, v_tno = kepler_propagate(tno_pos, tno_vel, np.linspace(0, 1000, 100))
+print("Kepler states for {0} bodies at {1} times".format(r_tno.shape[1], r_tno.shape[0]))
+
+# ---
+# 
+# Long Integrations with Bounded Memory
+# ---
+# 
+# Storing every step of $ x $, $ y $, $ v_{x} $, $ v_{y} $ and $ t $, and then calculating $ r $ and the energies as arrays of the same length, needs memory in proportion to the number of steps. For runs of millions of years with small steps, the output is decimated as the orbit is integrated instead:
+# 
+# * Either every $ k $-th state is kept,
+# * or, for each block of $ k $ steps, the smallest and largest values of $ r $, $ KE $, $ PE $ and $ TE $ are kept, so that peaks are not lost between samples.
+# 
+# When the output buffer fills up, neighbouring samples or blocks are merged in pairs and $ k $ is doubled, so the memory used never grows beyond the buffer size. The energy error is followed at every step: the largest value of $ |\Delta E / E_{0}| $, and the drift rate, from a running least-squares fit of $ \Delta E / E_{0} $ against time.
+# 
+# ---
+
+# In[ ]:
+
+
+# Integrate the orbit with orbit_steps, keeping at most max_samples rows of output,
+# starting with every every-th state, or the min/max envelope of each block of every steps
+# Returns a dictionary of the output arrays and the energy error statistics
+
+def orbit_decimated(pos_0, vel_0, t_max, every=1, max_samples=10000, envelope=False, delta_t=None, eta=None, method="verlet", iterations=2):
+    
+    max_samples = max(2, max_samples - max_samples % 2)     # An even number, so rows merge in pairs
+    out = np.empty((max_samples, 9 if envelope else 5))
+    n_out = 0
+    n_block = 0
+    
+    # Running energy error statistics
+    n = 0
+    t_mean = 0.0
+    err_mean = 0.0
+    t_var = 0.0
+    cov = 0.0
+    err_max = 0.0
+    
+    for t, pos, vel in orbit_steps(pos_0, vel_0, t_max, delta_t, eta, method, iterations):
+        r = np.sqrt(np.sum(pos**2))
+        KE = (1/2) * np.sum(vel**2)
+        PE = - GM / r
+        TE = KE + PE
+        
+        # Welford-style update of the means and co-moments of t and dE/E_0
+        if n == 0:
+            TE_0 = TE
+        err = (TE - TE_0) / TE_0
+        err_max = max(err_max, abs(err))
+        n += 1
+        d_t = t - t_mean
+        t_mean += d_t / n
+        err_mean += (err - err_mean) / n
+        t_var += d_t * (t - t_mean)
+        cov += d_t * (err - err_mean)
+        
+        if envelope:
+            values = np.array([r, KE, PE, TE])
+            if n_block == 0:
+                low, high = values, values
+            else:
+                low, high = np.minimum(low, values), np.maximum(high, values)
+            n_block += 1
+            if n_block == every:
+                out[n_out] = [t, *np.ravel([low, high], order="F")]
+                n_out += 1
+                n_block = 0
+        elif (n - 1) % every == 0:
+            out[n_out] = [t, pos[0], pos[1], vel[0], vel[1]]
+            n_out += 1
+        
+        # Buffer full: merge neighbouring rows and double the decimation
+        if n_out == max_samples:
+            if envelope:
+                first, second = out[0::2], out[1::2]
+                out[:max_samples//2, 0] = second[:, 0]
+                out[:max_samples//2, 1::2] = np.minimum(first[:, 1::2], second[:, 1::2])
+                out[:max_samples//2, 2::2] = np.maximum(first[:, 2::2], second[:, 2::2])
+            else:
+                out[:max_samples//2] = out[0::2]
+            n_out = max_samples//2
+            every *= 2
+    
+    if envelope and n_block > 0:                              # The last, partly filled block
+        out[n_out] = [t, *np.ravel([low, high], order="F")]
+        n_out += 1
+    
+    result = {
+        "every": every,
+        "steps": n - 1,
+        "max_energy_error": err_max,
+        "energy_drift_rate": cov / t_var if t_var > 0 else 0.0,   # Change in dE/E_0 per year
+        "t": out[:n_out, 0].copy(),
+    }
+    if envelope:
+        for i, name in enumerate(["r", "KE", "PE", "TE"]):
+            result[name + "_min"] = out[:n_out, 1 + 2*i].copy()
+            result[name + "_max"] = out[:n_out, 2 + 2*i].copy()
+    else:
+        for i, name in enumerate(["x", "y", "v_x", "v_y"]):
+            result[name] = out[:n_out, 1 + i].copy()
+    return result
+
+
+# In[ ]:
+
+
+# 100,000 years of Eris with 2,000 rows of output, compared for Euler-Cromer and Yoshida
+for name, options in [("Euler-Cromer, dt = 1 yr", {"delta_t": 1, "method": "euler_cromer"}),
+                      ("Yoshida, adaptive", {"eta": 0.05, "method": "yoshida"})]:
+    run = orbit_decimated([x[0], y[0]], [v_x[0], v_y[0]], 1e5, max_samples=2000, envelope=True, **options)
+    print("{0:>23}: steps = {1:6}, rows = {2}, max |dE/E| = {3:9.2e}, drift = {4:9.2e} per year".format(
+        name, run["steps"], len(run["t"]), run["max_energy_error"], run["energy_drift_rate"]))
+
+# Envelope of the total energy of the last run
+plt.fill_between(run["t"], run["TE_min"], run["TE_max"])
+plt.title("Total Energy Envelope - Yoshida technique")
+plt.xlabel("Time (yrs)")
+plt.ylabel("Energy Per Unit Mass ($AU^2 yr^{‒2}$)")
+plt.grid()
+plt.show()
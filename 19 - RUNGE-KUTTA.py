@@ -101,6 +101,261 @@ print("The volume of water remaining in the tank after 10 seconds is: {0:3} litr
 # 
 # - As evidenced by the table above, with a large step size a reasonable answer can be achieved, but to achieve a more accurate answer the step size must be increased
 
+# ---
+# ## General Runge-Kutta Technique
+# 
+# Every explicit Runge-Kutta technique follows the same pattern, and can be written down as a table of coefficients, called a Butcher tableau. For a technique with $ s $ stages:
+# $$ k_{i} = f(t_{n} + c_{i}h, V_{n} + h \sum_{j < i} a_{ij} k_{j}) $$
+# $$ V_{n + 1} = V_{n} + h \sum_{i} b_{i} k_{i} $$
+# 
+# The loop above is the second order midpoint technique; it calculates $ k_{3} $ but never uses it. With the coefficients stored in tables, one routine can run the midpoint, Heun, third order, classic fourth order and Dormand-Prince fifth order techniques on the same slope function, for a single value of $ V $ or an array of values.
+
+# In[ ]:
+
+
+# Butcher tableaux for explicit Runge-Kutta techniques
+# A holds the a_ij coefficients, b the weights and c the fractions of the step
+# Embedded pairs also hold b_hat, the weights of a solution one order lower
+TABLEAUS = {
+    "midpoint": {
+        "A": np.array([[0, 0], [1/2, 0]]),
+        "b": np.array([0, 1]),
+        "c": np.array([0, 1/2]),
+        "order": 2,
+    },
+    "heun": {
+        "A": np.array([[0, 0], [1, 0]]),
+        "b": np.array([1/2, 1/2]),
+        "c": np.array([0, 1]),
+        "order": 2,
+    },
+    "rk3": {
+        "A": np.array([[0, 0, 0], [1/2, 0, 0], [-1, 2, 0]]),
+        "b": np.array([1/6, 4/6, 1/6]),
+        "c": np.array([0, 1/2, 1]),
+        "order": 3,
+    },
+    "rk4": {
+        "A": np.array([[0, 0, 0, 0], [1/2, 0, 0, 0], [0, 1/2, 0, 0], [0, 0, 1, 0]]),
+        "b": np.array([1/6, 2/6, 2/6, 1/6]),
+        "c": np.array([0, 1/2, 1/2, 1]),
+        "order": 4,
+    },
+    "bs23": {
+        "A": np.array([[0, 0, 0, 0], [1/2, 0, 0, 0], [0, 3/4, 0, 0], [2/9, 1/3, 4/9, 0]]),
+        "b": np.array([2/9, 1/3, 4/9, 0]),
+        "b_hat": np.array([7/24, 1/4, 1/3, 1/8]),
+        "c": np.array([0, 1/2, 3/4, 1]),
+        "order": 3,
+    },
+    "dopri5": {
+        "A": np.array([[0, 0, 0, 0, 0, 0, 0],
+                       [1/5, 0, 0, 0, 0, 0, 0],
+                       [3/40, 9/40, 0, 0, 0, 0, 0],
+                       [44/45, -56/15, 32/9, 0, 0, 0, 0],
+                       [19372/6561, -25360/2187, 64448/6561, -212/729, 0, 0, 0],
+                       [9017/3168, -355/33, 46732/5247, 49/176, -5103/18656, 0, 0],
+                       [35/384, 0, 500/1113, 125/192, -2187/6784, 11/84, 0]]),
+        "b": np.array([35/384, 0, 500/1113, 125/192, -2187/6784, 11/84, 0]),
+        "b_hat": np.array([5179/57600, 0, 7571/16695, 393/640, -92097/339200, 187/2100, 1/40]),
+        "c": np.array([0, 1/5, 3/10, 4/5, 8/9, 1, 1]),
+        "order": 5,
+    },
+}
+
+
+# Take one Runge-Kutta step of size h from (t, V) using the given tableau
+# Returns V at the end of the step and the array of stage slopes k_i
+
+def rk_step(slope, t, V, h, tableau):
+    
+    A = tableau["A"]
+    b = tableau["b"]
+    c = tableau["c"]
+    
+    K = np.zeros((len(b),) + np.shape(V))
+    for i in range(len(b)):
+        # Slope at stage i, using the slopes of the earlier stages
+        K[i] = slope(t + c[i] * h, V + h * np.tensordot(A[i, :i], K[:i], axes=1))
+    
+    return V + h * np.tensordot(b, K, axes=1), K
+
+
+# Solve dV/dt = slope(t, V) from t_init to t_max with a fixed step delta_t
+# V_init can be a single value or an array, method is a key of TABLEAUS
+# Returns the arrays of t and V values
+
+def rk_solve(slope, t_init, V_init, t_max, delta_t, method="rk4"):
+    
+    tableau = TABLEAUS[method]
+    V_init = np.asarray(V_init, dtype=float)
+    N = int(round((t_max - t_init)/delta_t))   # Calculate number of jumps, rounded so the last lands on t_max
+    
+    t = np.zeros(N + 1)
+    V = np.zeros((N + 1,) + V_init.shape)
+    t[0] = t_init
+    V[0] = V_init
+    
+    for i in range(N):
+        V[i+1] = rk_step(slope, t[i], V[i], delta_t, tableau)[0]
+        t[i+1] = t[i] + delta_t
+    
+    return t, V
+
+
+# In[ ]:
+
+
+# Compare the techniques at delta_t = 2, counting the number of slope evaluations each one needs
+V_exact = 1.6026951787996095
+for method in TABLEAUS:
+    t_rk, V_rk = rk_solve(slope, t_init, V_init, t_max, 2, method)
+    n_slope = (len(t_rk) - 1) * len(TABLEAUS[method]["b"])
+    print("{0:>8}: V(10) ={1:14.10f}, error ={2:9.2e}, slope evaluations ={3:3}".format(method, V_rk[-1], abs(V_rk[-1] - V_exact), n_slope))
+
+
+# ---
+# ## Adaptive Step Size
+# 
+# A fixed $ \Delta t $ has to be small enough for the part of the solution that changes fastest, and is then wasted everywhere else. The embedded techniques (Bogacki-Shampine 3(2) and Dormand-Prince 5(4)) calculate two solutions of different order from the same slopes $ k_{i} $:
+# $$ V_{n + 1} = V_{n} + h \sum_{i} b_{i} k_{i} \qquad \hat V_{n + 1} = V_{n} + h \sum_{i} \hat b_{i} k_{i} $$
+# The difference between them estimates the error made in the step. A step is accepted when this error is within the tolerance $ atol + rtol |V| $, and either way the next step size is scaled by
+# $$ h_{new} = 0.9 h \left( \frac {1}{err} \right)^{1/p} $$
+# where $ p $ is the order of the technique, so the step grows where the solution is smooth and shrinks where it changes quickly.
+
+# In[ ]:
+
+
+# Solve dV/dt = slope(t, V) from t_init to t_max, choosing the step size to keep
+# the local error estimate within atol + rtol * |V|; method must be an embedded pair
+# Returns the arrays of t and V values and a dictionary of step counts
+# Raises RuntimeError if the solution stops being finite, the step size underflows,
+# or more than max_steps steps are tried
+
+def rk_adaptive(slope, t_init, V_init, t_max, method="dopri5", rtol=1e-6, atol=1e-9, h_init=None, max_steps=100000):
+    
+    tableau = TABLEAUS[method]
+    if "b_hat" not in tableau:
+        raise ValueError("method {0} has no embedded error estimate".format(method))
+    b_err = tableau["b"] - tableau["b_hat"]
+    exponent = 1 / tableau["order"]
+    
+    t = t_init
+    V = np.asarray(V_init, dtype=float)
+    h = (t_max - t_init) / 100 if h_init is None else h_init
+    t_list = [t]
+    V_list = [V]
+    accepted = 0
+    rejected = 0
+    
+    while t < t_max:
+        last = (t + h >= t_max)
+        if last:
+            h = t_max - t                # Finish exactly at t_max
+        
+        V_new, K = rk_step(slope, t, V, h, tableau)
+        
+        # Size of the error estimate relative to the tolerance
+        scale = atol + rtol * np.maximum(np.abs(V), np.abs(V_new))
+        err = np.sqrt(np.mean((h * np.tensordot(b_err, K, axes=1) / scale)**2))
+        if not np.isfinite(err):
+            raise RuntimeError("solution is not finite after t = {0}".format(t))
+        
+        if err <= 1:
+            t = t_max if last else t + h
+            V = V_new
+            t_list.append(t)
+            V_list.append(V)
+            accepted += 1
+        else:
+            rejected += 1
+        
+        # Grow or shrink the step, by no more than a factor of 5
+        h = h * (5 if err == 0 else min(5, max(0.2, 0.9 * err**(-exponent))))
+        if t < t_max and t + h == t:
+            raise RuntimeError("step size underflow at t = {0}".format(t))
+        if accepted + rejected >= max_steps and t < t_max:
+            raise RuntimeError("more than {0} steps needed, stopped at t = {1}".format(max_steps, t))
+    
+    stats = {
+        "accepted": accepted,
+        "rejected": rejected,
+        "evaluations": (accepted + rejected) * len(tableau["b"]),
+    }
+    return np.array(t_list), np.array(V_list), stats
+
+
+# In[ ]:
+
+
+# Reach the accuracy of the midpoint technique with delta_t = 0.02
+t_ad, V_ad, stats = rk_adaptive(slope, t_init, V_init, t_max, rtol=1e-6, atol=1e-8)
+print("Adaptive Dormand-Prince: V(10) ={0:14.10f}, error ={1:9.2e}".format(V_ad[-1], abs(V_ad[-1] - V_exact)))
+print("Accepted steps = {0}, rejected steps = {1}, slope evaluations = {2}".format(stats["accepted"], stats["rejected"], stats["evaluations"]))
+
+t_mid, V_mid = rk_solve(slope, t_init, V_init, t_max, 0.02, "midpoint")
+print("Midpoint, delta_t = 0.02: V(10) ={0:14.10f}, error ={1:9.2e}, slope evaluations = {2}".format(V_mid[-1], abs(V_mid[-1] - V_exact), 2 * (len(t_mid) - 1)))
+
+
+# ---
+# ## Convergence Study
+# 
+# The order of a technique can be measured by running it with a range of step sizes and fitting a straight line to $ \log_{10}(error) $ against $ \log_{10}(\Delta t) $. The routine below runs any fixed-step solver over a geometric sequence of step sizes, each in its own process, so the whole study takes about as long as the finest run.
+# 
+# When no analytical solution is available, the reference value is found by Richardson extrapolation from the three finest runs. If the error behaves as $ C \Delta t^{p} $, the order and the extrapolated value are:
+# $$ p = \frac {\log (|V_{3} - V_{2}| / |V_{2} - V_{1}|)} {\log (ratio)} \qquad V_{ref} = V_{1} + \frac {V_{1} - V_{2}} {ratio^{p} - 1} $$
+# where $ V_{1} $ is the result with the smallest step size.
+
+# In[ ]:
+
+
+# Process pools for running the step sizes in parallel
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+# Final value of V from one run of a fixed-step solver
+def final_value(solver, slope, t_init, V_init, t_max, delta_t):
+    return solver(slope, t_init, V_init, t_max, delta_t)[1][-1]
+
+
+# Run solver(slope, t_init, V_init, t_max, delta_t) for step sizes delta_t_max / ratio^i
+# and fit the order of the technique from a log-log graph of error against delta_t
+# The error is measured against exact if it is given, otherwise against a Richardson extrapolation
+# Returns the step sizes, final V values, errors, and the slope m and intercept c of the fit
+# solver and slope must be functions defined with def, so they can be sent to the worker processes
+
+def convergence_study(solver, slope, t_init, V_init, t_max, delta_t_max, levels=12, ratio=2, exact=None, processes=None):
+    
+    delta_t = delta_t_max / ratio ** np.arange(levels)
+    
+    # Forked workers can see the functions defined in this notebook
+    if "fork" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("fork")
+    else:
+        context = None
+    
+    # Each step size is an independent run; start the finest (slowest) first
+    run = partial(final_value, solver, slope, t_init, V_init, t_max)
+    with ProcessPoolExecutor(max_workers=processes or levels, mp_context=context) as pool:
+        V_end = np.array(list(pool.map(run, delta_t[::-1])))[::-1]
+    
+    if exact is None:
+        # Richardson extrapolation from the three finest runs
+        V_1, V_2, V_3 = V_end[-1], V_end[-2], V_end[-3]
+        p = np.log(np.max(np.abs(V_3 - V_2)) / np.max(np.abs(V_2 - V_1))) / np.log(ratio)
+        exact = V_1 + (V_1 - V_2) / (ratio**p - 1)
+    
+    # Largest error over the components of V
+    error = np.abs(V_end - exact).reshape(levels, -1).max(axis=1)
+    
+    # Fit a straight line on a log-log graph, ignoring runs that are exact to rounding
+    fit = error > 0
+    [m, c] = np.polyfit(np.log10(delta_t[fit]), np.log10(error[fit]), 1)
+    
+    return delta_t, V_end, error, m, c
+
+
 # Accuracy and Order of Runge-Kutta Technique:
 # ---
 
@@ -111,13 +366,10 @@ print("The volume of water remaining in the tank after 10 seconds is: {0:3} litr
 import numpy as np
 import matplotlib.pyplot as plt
 
-# Use results from solution to dV/dt = at - bV, V(0) = 0
-delta_t = np.array([2, 0.2, 0.02])
-V_10 = np.array([1.6125, 1.602719499, 1.602695405])
-
-# Use analytical solution to calculate Euler error
+# Solve dV/dt = at - bV, V(0) = 0 with the midpoint update used above,
+# for step sizes from 2 seconds down, and use the analytical solution to calculate the error
 V_analytic = 1.6026951787996095
-error = abs(V_10 - V_analytic)
+delta_t, V_10, error, m, c = convergence_study(partial(rk_solve, method="midpoint"), slope, t_init, V_init, t_max, 2, exact=V_analytic)
 
 plt.plot(delta_t, error, "ro")
 plt.xlabel("$\Delta t$")
@@ -18,15 +18,192 @@
 # In[4]:
 
 
-# Input values for f and do
-f = eval(input("Enter value for focal length in centimetres: "))
-do = eval(input("Enter value for object distance in centimetres: "))
+import sys
+import numpy as np
 
-# Calculate the image distance and magnification
-di = 1 / ((1/f) / (1/do))
-m = - (di/do)
+BATCH = "--batch" in sys.argv                   # Stream records instead of asking for one lens
 
-# Output the answer
-print ("The image distance is: {0:6.1} centimetres".format(di))
-print ("The magnification is: {0:10.2e}".format(m))
+# Image distance and magnification of a thin lens, from the focal length and object distance
+# f and do can be numbers or arrays of any shape
+def lens(f, do):
+    with np.errstate(divide="ignore"):          # An object at the focal point gives an image at infinity
+        di = 1 / (1/f - 1/do)
+    m = - (di/do)
+    return di, m
+
+
+def main():
+    # Input values for f and do
+    f = float(input("Enter value for focal length in centimetres: "))
+    do = float(input("Enter value for object distance in centimetres: "))
+    
+    # Calculate the image distance and magnification
+    di, m = lens(f, do)
+    
+    # Output the answer
+    print ("The image distance is: {0:6.1f} centimetres".format(di))
+    print ("The magnification is: {0:10.2e}".format(m))
+
+
+# ---
+# ## Batch Mode
+# 
+# Many lens configurations are handled by streaming records of $ (f, d_{o}) $ from a file or standard input, one pair per line, separated by commas or whitespace, with an optional header line. The records are read in blocks, the whole block is calculated at once with `lens()`, and the block of results is formatted and written out in one go, one line of $ f, d_{o}, d_{i}, m $ for each record.
+# 
+# Run the script with `--batch` to read standard input, or `--batch filename` to read a file.
+
+# In[ ]:
+
+
+from itertools import islice
+
+RECORD_FORMAT = "%.6g,%.6g,%.6g,%.6g\n"
+
+# True if field can be read as a number
+def is_number(field):
+    try:
+        float(field)
+    except ValueError:
+        return False
+    return True
+
+
+# Check each line of a block that failed to parse, and report the first bad record
+def bad_record(numbered):
+    for number, line in numbered:
+        fields = line.replace(",", " ").split()
+        try:
+            [float(field) for field in fields]
+        except ValueError:
+            return ValueError("Line {0}: could not read a number from {1!r}".format(number, line))
+        if len(fields) != 2:
+            return ValueError("Line {0}: expected a focal length and an object distance, found {1} values".format(number, len(fields)))
+    return ValueError("Could not read the records")
+
+
+# Read (f, do) records from src in blocks of block lines and write f, do, di, m to dst
+# Blank lines and lines starting with # are skipped, and so is a header line at the start
+# Returns the number of records processed
+def lens_batch(src, dst, block=100000):
+    n = 0
+    line_number = 0
+    first = True
+    while True:
+        lines = list(islice(src, block))
+        if not lines:
+            return n
+        
+        # Keep the line numbers of the records
+        numbered = []
+        for line in lines:
+            line_number += 1
+            line = line.strip()
+            if line and not line.startswith("#"):
+                numbered.append((line_number, line))
+        
+        # The first record may be a header, such as "f,do", if none of its fields are numbers
+        if first and numbered:
+            first = False
+            if not any(is_number(field) for field in numbered[0][1].replace(",", " ").split()):
+                numbered = numbered[1:]
+        if not numbered:
+            continue
+        
+        try:
+            values = np.loadtxt([line.replace(",", " ") for number, line in numbered], ndmin=2)   # Commas read as whitespace
+        except ValueError:
+            raise bad_record(numbered) from None
+        if values.shape[1] != 2:
+            raise bad_record(numbered)
+        
+        f, do = values.T
+        di, m = lens(f, do)
+        results = np.column_stack([f, do, di, m])
+        dst.write(RECORD_FORMAT * len(f) % tuple(results.ravel().tolist()))   # One write per block
+        n += len(f)
+
+
+# ---
+# ## Systems of Lenses
+# 
+# A ray crossing the axis at height $ y $ and angle $ \theta $ is carried through a thin lens and across a gap of length $ d $ by the ray-transfer (ABCD) matrices:
+# 
+# $$ L = \begin{pmatrix} 1 & 0 \\ -\frac{1}{f} & 1 \end{pmatrix} \qquad T = \begin{pmatrix} 1 & d \\ 0 & 1 \end{pmatrix} $$
+# 
+# A stack of lenses is the product of these matrices, last element on the left:
+# 
+# $$ M = L_{n} T_{n-1} \cdots T_{1} L_{1} = \begin{pmatrix} A & B \\ C & D \end{pmatrix} $$
+# 
+# * The effective focal length is $ f_{eff} = - \frac{1}{C} $
+# * With the object $ d_{o} $ before the first lens, the image forms where $ T(d_{i}) \, M \, T(d_{o}) $ has no $ B $ element: $ d_{i} = - \frac{A d_{o} + B}{C d_{o} + D} $ after the last lens
+# * The magnification is then $ m = A + d_{i} C $
+# 
+# Every configuration in a batch is multiplied at once as a stack of $ 2 \times 2 $ matrices, so thousands of lens spacings cost one matrix product per element.
+
+# In[ ]:
+
+
+# Ray-transfer matrix of a stack of thin lenses
+# focal_lengths has shape (configurations, lenses), gaps has shape (configurations, lenses - 1)
+# Returns the (configurations, 2, 2) system matrices
+def system_matrix(focal_lengths, gaps):
+    focal_lengths = np.atleast_2d(np.asarray(focal_lengths, dtype=float))
+    gaps = np.atleast_2d(np.asarray(gaps, dtype=float)).reshape(len(focal_lengths), -1)
+    n_config, n_lens = focal_lengths.shape
+    if gaps.shape[1] != n_lens - 1:
+        raise ValueError("Need one gap between each pair of lenses")
+    
+    element = np.zeros((n_config, 2, 2))
+    element[:, 0, 0] = element[:, 1, 1] = 1
+    element[:, 1, 0] = -1 / focal_lengths[:, 0]
+    M = element.copy()
+    for i in range(1, n_lens):
+        element[:, 1, 0] = 0                    # Gap before lens i
+        element[:, 0, 1] = gaps[:, i-1]
+        M = element @ M
+        element[:, 0, 1] = 0                    # Lens i
+        element[:, 1, 0] = -1 / focal_lengths[:, i]
+        M = element @ M
+    return M
+
+
+# Effective focal length, image distance after the last lens and magnification
+# for each configuration of a stack of thin lenses, with the object do before the first lens
+def lens_system(focal_lengths, gaps, do):
+    M = system_matrix(focal_lengths, gaps)
+    A, B, C, D = M[:, 0, 0], M[:, 0, 1], M[:, 1, 0], M[:, 1, 1]
+    with np.errstate(divide="ignore"):          # Afocal systems and objects at a focal point
+        efl = -1 / C
+        di = - (A*do + B) / (C*do + D)
+    m = A + di*C
+    return efl, di, m
+
+
+# In[ ]:
+
+
+if not BATCH:
+    # A single lens gives the same answer as lens()
+    efl, di, m = lens_system([[10]], np.empty((1, 0)), 30)
+    print("Single lens: f = {0:6.1f} cm, di = {1:6.1f} cm, m = {2:10.2e}".format(efl[0], di[0], m[0]))
+    
+    # Sweep the spacing of a pair of lenses, f = 10 cm and 20 cm
+    d = np.linspace(0, 25, 6)
+    f_pair = np.column_stack([np.full_like(d, 10), np.full_like(d, 20)])
+    efl, di, m = lens_system(f_pair, d[:, None], 30)
+    for row in zip(d, efl, di, m):
+        print("d = {0:5.1f} cm: f = {1:8.2f} cm, di = {2:8.2f} cm, m = {3:10.2e}".format(*row))
+
+# In[ ]:
+
+
+if BATCH:
+    args = sys.argv[sys.argv.index("--batch") + 1:]
+    if args:
+        with open(args[0]) as src:
+            lens_batch(src, sys.stdout)
+    else:
+        lens_batch(sys.stdin, sys.stdout)
+else:
+    main()
 
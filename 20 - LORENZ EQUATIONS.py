@@ -87,3 +87,582 @@ plt.title('Lorenz System')   # Title of the system
 plt.grid()
 plt.show()
 
+
+# ---
+# ## Ensemble Integration
+# 
+# To forecast with an ensemble of perturbed initial states, the Lorenz equations have to be solved thousands of times. Rather than calling the ODE solver once per state, all the states are held together in an array of shape $ (M, 3) $, and each stage of the Runge-Kutta technique evaluates the Lorenz equations for the whole ensemble in one NumPy operation.
+# 
+# * Fixed step: the classic fourth order Runge-Kutta technique
+# * Adaptive step: the Dormand-Prince 5(4) pair, with one step size shared by the ensemble and chosen so that every member meets the tolerance
+# 
+# The parameters $ r $, $ s $ and $ b $ may be single values or arrays with one value per member.
+
+# In[ ]:
+
+
+# Define the Lorenz equations for an ensemble of states XYZ with shape (M, 3)
+# The rates of change are written into out, if it is given
+def lorenz_batch(t, XYZ, r, s, b, out=None):
+    if out is None:
+        out = np.empty_like(XYZ)
+    x, y, z = XYZ[:, 0], XYZ[:, 1], XYZ[:, 2]    # Views of the x, y and z columns
+    out[:, 0] = s*(y - x)                        # Rate of change of x with respect to time
+    out[:, 1] = r*x - y - x*z                    # Rate of change of y with respect to time
+    out[:, 2] = x*y - b*z                        # Rate of change of z with respect to time
+    return out
+
+
+# Take one fourth order Runge-Kutta step of the ensemble XYZ in place
+# K is a scratch array of shape (5,) + XYZ.shape; on return K[0] holds the slopes at the start of the step
+# rhs can replace the Lorenz equations with another function of the same form
+def lorenz_rk4_step(t, XYZ, delta_t, r, s, b, K, rhs=lorenz_batch):
+    k1, k2, k3, k4, tmp = K
+    rhs(t, XYZ, r, s, b, out=k1)
+    np.multiply(k1, delta_t/2, out=tmp)
+    tmp += XYZ
+    rhs(t + delta_t/2, tmp, r, s, b, out=k2)
+    np.multiply(k2, delta_t/2, out=tmp)
+    tmp += XYZ
+    rhs(t + delta_t/2, tmp, r, s, b, out=k3)
+    np.multiply(k3, delta_t, out=tmp)
+    tmp += XYZ
+    rhs(t + delta_t, tmp, r, s, b, out=k4)
+    
+    # XYZ += delta_t/6 * (k1 + 2 k2 + 2 k3 + k4), without temporary arrays
+    k2 += k3
+    k2 *= 2
+    k2 += k1
+    k2 += k4
+    k2 *= delta_t/6
+    XYZ += k2
+    return XYZ
+
+
+# Dormand-Prince 5(4) coefficients; DP_E holds the difference between the 5th and 4th order weights
+DP_A = np.array([[0, 0, 0, 0, 0, 0],
+                 [1/5, 0, 0, 0, 0, 0],
+                 [3/40, 9/40, 0, 0, 0, 0],
+                 [44/45, -56/15, 32/9, 0, 0, 0],
+                 [19372/6561, -25360/2187, 64448/6561, -212/729, 0, 0],
+                 [9017/3168, -355/33, 46732/5247, 49/176, -5103/18656, 0],
+                 [35/384, 0, 500/1113, 125/192, -2187/6784, 11/84]])
+DP_C = np.array([0, 1/5, 3/10, 4/5, 8/9, 1, 1])
+DP_E = np.array([71/57600, 0, -71/16695, 71/1920, -17253/339200, 22/525, -1/40])
+
+
+# Solve the Lorenz equations for every state in XYZ_0 over t_span
+# With delta_t the fixed step fourth order Runge-Kutta technique is used,
+# otherwise the step size is adapted to keep the error within atol + rtol * |xyz|
+# Returns the states at t_span[1] and a dictionary of step counts
+# Raises RuntimeError if a state stops being finite, the step size underflows,
+# or more than max_steps steps are tried
+
+def lorenz_ensemble(XYZ_0, t_span, r, s, b, delta_t=None, rtol=1e-6, atol=1e-9, max_steps=100000):
+    
+    XYZ = np.array(XYZ_0, dtype=float)
+    t, t_end = t_span
+    
+    if delta_t is not None:
+        N = int(np.ceil((t_end - t)/delta_t))    # Shrink the step slightly so the last step lands on t_end
+        if N <= 0:
+            return XYZ, {"accepted": 0, "rejected": 0, "evaluations": 0}
+        delta_t = (t_end - t)/N
+        K = np.empty((5,) + XYZ.shape)
+        for i in range(N):
+            lorenz_rk4_step(t + i*delta_t, XYZ, delta_t, r, s, b, K)
+        return XYZ, {"accepted": N, "rejected": 0, "evaluations": 4*N}
+    
+    K = np.empty((7,) + XYZ.shape)
+    lorenz_batch(t, XYZ, r, s, b, out=K[0])
+    h = (t_end - t)/100
+    accepted = 0
+    rejected = 0
+    evaluations = 1
+    
+    while t < t_end:
+        last = (t + h >= t_end)
+        if last:
+            h = t_end - t
+        
+        # Stages 2 to 7; the 7th stage is the slope at the new state
+        for i in range(1, 7):
+            XYZ_i = XYZ + h * np.tensordot(DP_A[i, :i], K[:i], axes=1)
+            lorenz_batch(t + DP_C[i]*h, XYZ_i, r, s, b, out=K[i])
+        evaluations += 6
+        
+        # Error of the worst member relative to the tolerance
+        scale = atol + rtol * np.maximum(np.abs(XYZ), np.abs(XYZ_i))
+        err = np.sqrt(np.max(np.mean((h * np.tensordot(DP_E, K, axes=1) / scale)**2, axis=1)))
+        if not np.isfinite(err):
+            raise RuntimeError("ensemble is not finite after t = {0}".format(t))
+        
+        if err <= 1:
+            t = t_end if last else t + h
+            XYZ = XYZ_i
+            K[0] = K[6]                          # The last slope is the first slope of the next step
+            accepted += 1
+        else:
+            rejected += 1
+        
+        h = h * (5 if err == 0 else min(5, max(0.2, 0.9 * err**(-1/5))))
+        if t < t_end and t + h == t:
+            raise RuntimeError("step size underflow at t = {0}".format(t))
+        if accepted + rejected >= max_steps and t < t_end:
+            raise RuntimeError("more than {0} steps needed, stopped at t = {1}".format(max_steps, t))
+    
+    return XYZ, {"accepted": accepted, "rejected": rejected, "evaluations": evaluations}
+
+
+# In[ ]:
+
+
+# Compare the ensemble integrator with one call of solve_ivp per member
+import time
+
+M = 200                                          # Number of members in the ensemble
+rng = np.random.default_rng(1)
+XYZ_ens = xyz_0 + 1e-3 * rng.standard_normal((M, 3))
+t_span_ens = [0, 1]
+
+start = time.perf_counter()
+for i in range(M):
+    solve_ivp(lorenz, t_span_ens, XYZ_ens[i], args=(r, s, b), rtol=1e-6, atol=1e-9)
+time_loop = time.perf_counter() - start
+
+start = time.perf_counter()
+XYZ_end, steps = lorenz_ensemble(XYZ_ens, t_span_ens, r, s, b, rtol=1e-6, atol=1e-9)
+time_adaptive = time.perf_counter() - start
+
+start = time.perf_counter()
+XYZ_end_rk4, _ = lorenz_ensemble(XYZ_ens, t_span_ens, r, s, b, delta_t=1e-3)
+time_rk4 = time.perf_counter() - start
+
+print("{0} separate solve_ivp calls: {1:8.3f} s".format(M, time_loop))
+print("Adaptive ensemble:           {0:8.3f} s, {1} steps accepted, {2} rejected".format(time_adaptive, steps["accepted"], steps["rejected"]))
+print("Fixed step RK4 ensemble:     {0:8.3f} s".format(time_rk4))
+print("Largest difference between the two ensemble results: {0:8.2e}".format(np.abs(XYZ_end - XYZ_end_rk4).max()))
+
+
+# ---
+# ## Largest Lyapunov Exponent
+# 
+# Two nearby states of the Lorenz system separate at an average exponential rate $ e^{\lambda t} $, where $ \lambda $ is the largest Lyapunov exponent. A small perturbation $ \delta $ of the state obeys the tangent-linear equations $ \frac {d\delta}{dt} = J \delta $, where $ J $ is the Jacobian of the Lorenz equations:
+# $$ J = \begin{pmatrix} -s & s & 0 \\ r - z & -1 & -x \\ y & x & -b \end{pmatrix} $$
+# 
+# The state and the perturbation are integrated together. Every few steps the perturbation is scaled back to unit length, and the logarithm of its growth is added to a running sum, so that
+# $$ \lambda \approx \frac {1}{t} \sum \ln |\delta| $$
+# 
+# Only the current state, perturbation and running sum are kept, so the memory used does not grow with the length of the run, and running estimates are produced as the integration goes along.
+
+# In[ ]:
+
+
+# Lorenz equations together with their tangent-linear equations
+# W has shape (M, 6): the state (x, y, z) followed by the perturbation (dx, dy, dz)
+def lorenz_with_tangent(t, W, r, s, b, out=None):
+    if out is None:
+        out = np.empty_like(W)
+    lorenz_batch(t, W[:, :3], r, s, b, out=out[:, :3])
+    x, y, z = W[:, 0], W[:, 1], W[:, 2]
+    dx, dy, dz = W[:, 3], W[:, 4], W[:, 5]
+    out[:, 3] = s*(dy - dx)                      # Rows of the Jacobian applied to the perturbation
+    out[:, 4] = (r - z)*dx - dy - x*dz
+    out[:, 5] = y*dx + x*dy - b*dz
+    return out
+
+
+# Estimate the largest Lyapunov exponent of each state in XYZ_0, which has shape (3,) or (M, 3)
+# The states first settle onto the attractor for t_transient, then the perturbations are
+# renormalised every renorm_every steps, and after every report_every renormalisations
+# the elapsed time and the running estimates are yielded, until t_max is reached
+
+def lorenz_lyapunov(XYZ_0, r, s, b, delta_t=0.01, t_max=np.inf, t_transient=10, renorm_every=10, report_every=100):
+    
+    XYZ = np.atleast_2d(np.array(XYZ_0, dtype=float))
+    M = len(XYZ)
+    
+    # Let the states settle onto the attractor
+    K = np.empty((5, M, 3))
+    for i in range(int(t_transient/delta_t)):
+        lorenz_rk4_step(i*delta_t, XYZ, delta_t, r, s, b, K)
+    
+    # Start with a unit perturbation of each state
+    W = np.empty((M, 6))
+    W[:, :3] = XYZ
+    W[:, 3:] = 1/np.sqrt(3)
+    K = np.empty((5, M, 6))
+    log_growth = np.zeros(M)
+    n_steps = 0
+    n_renorm = 0
+    
+    while n_steps*delta_t < t_max:
+        for i in range(renorm_every):
+            lorenz_rk4_step(n_steps*delta_t, W, delta_t, r, s, b, K, rhs=lorenz_with_tangent)
+            n_steps += 1
+        
+        # Rescale the perturbations to unit length and record how much they grew
+        growth = np.sqrt(np.sum(W[:, 3:]**2, axis=1))
+        log_growth += np.log(growth)
+        W[:, 3:] /= growth[:, None]
+        n_renorm += 1
+        
+        if n_renorm % report_every == 0:
+            t = n_steps*delta_t
+            yield t, log_growth/t
+
+
+# In[ ]:
+
+
+# Running estimates of the largest Lyapunov exponent for r = 100, and for the classic r = 28
+for t_lyap, lyap in lorenz_lyapunov(xyz_0, r, s, b, t_max=100, report_every=250):
+    print("r = {0:3}, t = {1:6.1f}, largest Lyapunov exponent = {2:6.3f}".format(r, t_lyap, lyap[0]))
+
+for t_lyap, lyap in lorenz_lyapunov(xyz_0, 28, s, 8/3, t_max=100, report_every=250):
+    print("r = {0:3}, t = {1:6.1f}, largest Lyapunov exponent = {2:6.3f}".format(28, t_lyap, lyap[0]))
+
+# ---
+# ## Parameter Sweep
+# 
+# The function `lorenz(t, xyz, r, s, b)` already takes its parameters as arguments, so the behaviour of the system can be mapped over a grid of $ (r, s, b) $ values. The grid is split into chunks which are shared out across a pool of processes. Each process integrates its chunk as one ensemble, with one set of parameters per member, and writes only summary statistics into shared-memory arrays, so no trajectories are sent back between processes:
+# 
+# * The largest Lyapunov exponent
+# * The smallest and largest values of $ x $, $ y $ and $ z $ on the attractor
+# * The successive local maxima of $ z $, for bifurcation diagrams
+# 
+# Each local maximum of $ z $ is refined by fitting a parabola through the three samples around it.
+
+# In[ ]:
+
+
+# Shared memory lets the worker processes write straight into the result arrays
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+
+# Columns of the summary statistics produced by lorenz_sweep
+SWEEP_STATS = ["lyapunov", "x_min", "x_max", "y_min", "y_max", "z_min", "z_max"]
+
+
+# Integrate the parameter sets r, s and b, which are the rows index of the full grid, and write
+# their statistics into the shared arrays named stats_name, with shape (P, len(SWEEP_STATS)),
+# and maxima_name, with shape (P, n_maxima)
+def lorenz_sweep_chunk(stats_name, maxima_name, P, n_maxima, index, r, s, b, xyz_0, delta_t, t_transient, t_run, renorm_every):
+    
+    stats_shm = shared_memory.SharedMemory(name=stats_name)
+    maxima_shm = shared_memory.SharedMemory(name=maxima_name)
+    stats = np.ndarray((P, len(SWEEP_STATS)), dtype=float, buffer=stats_shm.buf)
+    maxima = np.ndarray((P, n_maxima), dtype=float, buffer=maxima_shm.buf)
+    
+    m = len(index)
+    
+    # Let the states settle onto the attractor
+    XYZ = np.tile(np.asarray(xyz_0, dtype=float), (m, 1))
+    K = np.empty((5, m, 3))
+    for i in range(int(t_transient/delta_t)):
+        lorenz_rk4_step(i*delta_t, XYZ, delta_t, r, s, b, K)
+    
+    # State and unit perturbation of each member
+    W = np.empty((m, 6))
+    W[:, :3] = XYZ
+    W[:, 3:] = 1/np.sqrt(3)
+    K = np.empty((5, m, 6))
+    
+    log_growth = np.zeros(m)
+    low = W[:, :3].copy()
+    high = W[:, :3].copy()
+    n_found = np.zeros(m, dtype=int)
+    z_0 = W[:, 2].copy()
+    z_1 = W[:, 2].copy()
+    
+    N = int(t_run/delta_t)
+    for i in range(1, N + 1):
+        lorenz_rk4_step(i*delta_t, W, delta_t, r, s, b, K, rhs=lorenz_with_tangent)
+        np.minimum(low, W[:, :3], out=low)
+        np.maximum(high, W[:, :3], out=high)
+        
+        # z_1 is a local maximum if it is above both of its neighbours
+        z_2 = W[:, 2]
+        peak = (z_1 > z_0) & (z_1 >= z_2) & (n_found < n_maxima)
+        if peak.any():
+            curve = z_0[peak] - 2*z_1[peak] + z_2[peak]
+            maxima[index[peak], n_found[peak]] = z_1[peak] - (z_2[peak] - z_0[peak])**2 / (8*curve)
+            n_found[peak] += 1
+        z_0[:] = z_1
+        z_1[:] = z_2
+        
+        # Renormalise the perturbations and record how much they grew
+        if i % renorm_every == 0:
+            growth = np.sqrt(np.sum(W[:, 3:]**2, axis=1))
+            log_growth += np.log(growth)
+            W[:, 3:] /= growth[:, None]
+    
+    stats[index, 0] = log_growth/((N // renorm_every) * renorm_every * delta_t)
+    stats[index, 1::2] = low
+    stats[index, 2::2] = high
+    
+    stats_shm.close()
+    maxima_shm.close()
+
+
+# Run the Lorenz equations for every combination of r, s and b (which are broadcast together)
+# from the initial state xyz_0, across a pool of processes
+# Returns a dictionary of statistics, each with the broadcast shape of r, s and b, and
+# an array of the first n_maxima local maxima of z after the transient, padded with NaN
+
+def lorenz_sweep(r, s, b, xyz_0, delta_t=0.01, t_transient=10, t_run=100, n_maxima=100, renorm_every=10, processes=None):
+    
+    r, s, b = np.broadcast_arrays(np.asarray(r, dtype=float), np.asarray(s, dtype=float), np.asarray(b, dtype=float))
+    shape = r.shape
+    r, s, b = r.ravel(), s.ravel(), b.ravel()
+    P = len(r)
+    
+    # The Lyapunov exponent needs at least one renormalisation of the perturbations
+    if int(t_run/delta_t) < renorm_every:
+        raise ValueError("t_run = {0} is shorter than renorm_every * delta_t = {1}".format(t_run, renorm_every * delta_t))
+    if P == 0:
+        return {name: np.zeros(shape) for name in SWEEP_STATS}, np.zeros(shape + (n_maxima,))
+    
+    # Shared arrays for the results, filled by the workers
+    stats_shm = shared_memory.SharedMemory(create=True, size=8 * P * len(SWEEP_STATS))
+    maxima_shm = shared_memory.SharedMemory(create=True, size=8 * P * max(n_maxima, 1))
+    stats = np.ndarray((P, len(SWEEP_STATS)), dtype=float, buffer=stats_shm.buf)
+    maxima = np.ndarray((P, n_maxima), dtype=float, buffer=maxima_shm.buf)
+    maxima[:] = np.nan
+    
+    # Forked workers can see the functions defined in this notebook
+    if "fork" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("fork")
+    else:
+        context = None
+    
+    processes = processes or multiprocessing.cpu_count()
+    chunks = np.array_split(np.arange(P), min(P, 4 * processes))
+    try:
+        with ProcessPoolExecutor(max_workers=processes, mp_context=context) as pool:
+            # Each job is sent only its own part of the grid
+            jobs = [pool.submit(lorenz_sweep_chunk, stats_shm.name, maxima_shm.name, P, n_maxima, index,
+                                r[index], s[index], b[index], xyz_0, delta_t, t_transient, t_run, renorm_every) for index in chunks]
+            for job in jobs:
+                job.result()                     # Raise any error from the workers
+        
+        results = {name: stats[:, i].reshape(shape).copy() for i, name in enumerate(SWEEP_STATS)}
+        z_maxima = maxima.reshape(shape + (n_maxima,)).copy()
+    finally:
+        del stats, maxima
+        stats_shm.close()
+        stats_shm.unlink()
+        maxima_shm.close()
+        maxima_shm.unlink()
+    
+    return results, z_maxima
+
+
+# In[ ]:
+
+
+# Sweep r with s = 10 and b = 8/3, and plot the local maxima of z against r
+r_sweep = np.linspace(20, 200, 91)
+sweep, z_peaks = lorenz_sweep(r_sweep, 10, 8/3, xyz_0, t_run=20, n_maxima=50)
+
+for i in range(0, len(r_sweep), 15):
+    print("r = {0:6.1f}, Lyapunov exponent = {1:6.3f}, maximum z = {2:7.2f}".format(r_sweep[i], sweep["lyapunov"][i], sweep["z_max"][i]))
+
+plt.plot(np.repeat(r_sweep, z_peaks.shape[1]), z_peaks.ravel(), "k.", markersize=1)
+plt.xlabel('r')
+plt.ylabel('local maxima of z')
+plt.title('Lorenz System - Bifurcation Diagram')
+plt.grid()
+plt.show()
+
+# ---
+# ## Trajectories Written to Disk
+# 
+# For very long runs the whole trajectory does not fit in memory. Instead, the states are collected in a fixed-size block, and each full block is written into a `.npy` file through a memory map of just that part of the file. The memory used stays the same however long the run is, and the finished file can be opened again with `np.load(..., mmap_mode="r")`, which reads the data from disk only as it is used, without copying it.
+
+# In[ ]:
+
+
+# Solve the Lorenz equations for XYZ_0, of shape (3,) or (M, 3), over t_span with the fixed step
+# fourth order Runge-Kutta technique, and save every save_every-th state to the .npy file filename,
+# chunk samples at a time; sample i is the state at time t_span[0] + i * save_every * delta_t
+# Returns the saved trajectory, opened read-only as a memory map
+
+def lorenz_to_npy(filename, XYZ_0, t_span, delta_t, r, s, b, save_every=1, chunk=65536):
+    
+    shape = np.shape(XYZ_0)
+    XYZ = np.atleast_2d(np.array(XYZ_0, dtype=float))
+    N = int(round((t_span[1] - t_span[0])/delta_t))   # Calculate the number of steps
+    n_samples = N // save_every + 1
+    
+    # Create the file with its header, and find where the data starts
+    out = np.lib.format.open_memmap(filename, mode="w+", dtype=float, shape=(n_samples,) + shape)
+    offset = out.offset
+    del out
+    
+    K = np.empty((5,) + XYZ.shape)
+    block = np.empty((chunk,) + XYZ.shape)
+    filled = 0
+    written = 0
+    
+    # Write the filled part of the block through a map of just that part of the file
+    def write_block():
+        nonlocal filled, written
+        part = np.memmap(filename, dtype=float, mode="r+", offset=offset + written*block[0].nbytes, shape=(filled,) + shape)
+        part[:] = block[:filled].reshape((filled,) + shape)
+        part.flush()
+        del part
+        written += filled
+        filled = 0
+    
+    step = 0
+    for i in range(n_samples):
+        if i > 0:
+            for j in range(save_every):
+                lorenz_rk4_step(t_span[0] + step*delta_t, XYZ, delta_t, r, s, b, K)
+                step += 1
+        if filled == chunk:                      # Make room by writing the full block
+            write_block()
+        block[filled] = XYZ
+        filled += 1
+    write_block()                                # The last, partly filled block
+    
+    return np.load(filename, mmap_mode="r")
+
+
+# In[ ]:
+
+
+# Save a run of 100,000 steps to a temporary file and plot it straight from the file
+import os
+import tempfile
+
+trajectory_file = os.path.join(tempfile.gettempdir(), "lorenz_trajectory.npy")
+trajectory = lorenz_to_npy(trajectory_file, xyz_0, [0, 100], 0.001, r, s, b, save_every=10, chunk=4096)
+print("Saved {0} states to {1}".format(len(trajectory), trajectory_file))
+
+plt.plot(trajectory[:, 0], trajectory[:, 2], linewidth=0.2)   # Plot x versus z
+plt.xlabel('x')
+plt.ylabel('z')
+plt.title('Lorenz System - from file')
+plt.grid()
+plt.show()
+
+# ---
+# ## Poincaré Sections and Events
+# 
+# Return-map studies only need the points where the trajectory crosses a surface, such as the plane $ z = r - 1 $, or the successive maxima of $ z $, where $ \frac {dz}{dt} = xy - bz $ changes from positive to negative. An event is described by a function $ g(x, y, z) $ whose sign changes at the crossing.
+# 
+# After each step the sign of $ g $ is checked for every member of the ensemble. Within a step where it changes, the trajectory is interpolated with the cubic Hermite polynomial through the states and slopes at both ends of the step,
+# $$ xyz(\theta) = h_{00}(\theta) xyz_{n} + h_{10}(\theta) \Delta t f_{n} + h_{01}(\theta) xyz_{n+1} + h_{11}(\theta) \Delta t f_{n+1} $$
+# and the crossing is refined by a bracketed secant (Illinois) search for the root of $ g(xyz(\theta)) $. Only the event records are produced; the trajectory itself is never stored.
+
+# In[ ]:
+
+
+# Cubic Hermite interpolation between states XYZ_0 and XYZ_1, with slopes F_0 and F_1,
+# at fractions theta of a step delta_t
+def hermite(XYZ_0, F_0, XYZ_1, F_1, delta_t, theta):
+    theta = theta[:, None]
+    h00 = (2*theta - 3)*theta**2 + 1
+    h10 = ((theta - 2)*theta + 1)*theta
+    h01 = (3 - 2*theta)*theta**2
+    h11 = (theta - 1)*theta**2
+    return h00*XYZ_0 + h10*delta_t*F_0 + h01*XYZ_1 + h11*delta_t*F_1
+
+
+# Solve the Lorenz equations for XYZ_0, of shape (3,) or (M, 3), over t_span with the fixed step
+# fourth order Runge-Kutta technique, and find where event(XYZ, r, s, b) crosses zero
+# direction > 0 only counts increasing crossings, direction < 0 only decreasing ones
+# Each crossing is refined until the fraction of the step changes by less than tol
+# Yields (members, times, states) for each step in which crossings happen after t_transient
+
+def lorenz_events(XYZ_0, t_span, delta_t, r, s, b, event, direction=0, t_transient=0, tol=1e-12, max_iter=50):
+    
+    XYZ = np.atleast_2d(np.array(XYZ_0, dtype=float))
+    N = int(round((t_span[1] - t_span[0])/delta_t))   # Calculate the number of steps
+    K = np.empty((5,) + XYZ.shape)
+    XYZ_prev = np.empty_like(XYZ)
+    g_prev = event(XYZ, r, s, b)
+    
+    for i in range(N):
+        t = t_span[0] + i*delta_t
+        XYZ_prev[:] = XYZ
+        lorenz_rk4_step(t, XYZ, delta_t, r, s, b, K)
+        g = event(XYZ, r, s, b)
+        
+        # Members whose event function changed sign in this step
+        rising = (g_prev < 0) & (g >= 0)
+        falling = (g_prev > 0) & (g <= 0)
+        if direction > 0:
+            crossed = rising
+        elif direction < 0:
+            crossed = falling
+        else:
+            crossed = rising | falling
+        
+        if t + delta_t > t_transient and crossed.any():
+            idx = np.nonzero(crossed)[0]
+            r_i, s_i, b_i = [p[idx] if np.ndim(p) else p for p in (r, s, b)]
+            
+            # States and slopes at both ends of the step, for the crossing members only
+            XYZ_0, F_0 = XYZ_prev[idx], K[0][idx]
+            XYZ_1 = XYZ[idx]
+            F_1 = lorenz_batch(t + delta_t, XYZ_1, r_i, s_i, b_i)
+            
+            # Illinois search for the root, which stays bracketed between theta_a and theta_b
+            theta_a, g_a = np.zeros(len(idx)), g_prev[idx]
+            theta_b, g_b = np.ones(len(idx)), g[idx]
+            theta = theta_b
+            for j in range(max_iter):
+                theta_old = theta
+                theta = theta_b - g_b*(theta_b - theta_a)/(g_b - g_a)
+                g_theta = event(hermite(XYZ_0, F_0, XYZ_1, F_1, delta_t, theta), r_i, s_i, b_i)
+                
+                # Keep the end whose g has the opposite sign; if the same end is kept again, halve its g
+                flip = g_theta * g_b < 0
+                theta_a = np.where(flip, theta_b, theta_a)
+                g_a = np.where(flip, g_b, g_a/2)
+                theta_b, g_b = theta, g_theta
+                
+                if np.all(np.abs(theta - theta_old) <= tol):
+                    break
+            
+            yield idx, t + theta*delta_t, hermite(XYZ_0, F_0, XYZ_1, F_1, delta_t, theta)
+        
+        g_prev = g
+
+
+# In[ ]:
+
+
+# Crossings of the plane z = r - 1 from below, and the maxima of z, where dz/dt falls through zero
+def z_plane(XYZ, r, s, b):
+    return XYZ[:, 2] - (r - 1)
+
+def z_rate(XYZ, r, s, b):
+    return XYZ[:, 0]*XYZ[:, 1] - b*XYZ[:, 2]
+
+# Poincaré section of a small ensemble for the classic parameters r = 28, s = 10, b = 8/3
+XYZ_section = xyz_0[None, :] + np.arange(5)[:, None] * np.array([0.1, 0, 0])
+section = [XYZ_e for idx, t_e, XYZ_e in lorenz_events(XYZ_section, [0, 100], 0.005, 28, 10, 8/3, z_plane, direction=1, t_transient=5)]
+section = np.concatenate(section)
+
+plt.plot(section[:, 0], section[:, 1], "k.", markersize=2)
+plt.xlabel('x')
+plt.ylabel('y')
+plt.title('Lorenz System - Poincaré section z = r - 1')
+plt.grid()
+plt.show()
+
+# Lorenz return map: each maximum of z against the one before it
+z_maxima = np.concatenate([XYZ_e[:, 2] for idx, t_e, XYZ_e in lorenz_events(xyz_0, [0, 100], 0.005, 28, 10, 8/3, z_rate, direction=-1, t_transient=5)])
+print("Found {0} crossings of the plane and {1} maxima of z".format(len(section), len(z_maxima)))
+
+plt.plot(z_maxima[:-1], z_maxima[1:], "k.", markersize=2)
+plt.xlabel('$z_n$')
+plt.ylabel('$z_{n+1}$')
+plt.title('Lorenz System - return map of the maxima of z')
+plt.grid()
+plt.show()
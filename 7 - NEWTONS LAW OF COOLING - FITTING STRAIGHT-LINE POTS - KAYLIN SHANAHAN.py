@@ -84,3 +84,87 @@ LnTemp_fit = m * t10 + c
 plt.plot(t10, LnTemp_fit)
 plt.show()
 
+
+# ---
+# ## Streaming Fit
+# 
+# `polyfit` needs all of the data in memory at once. A continuous temperature log is fitted instead by keeping only the sufficient statistics of the straight line: the number of points $ n $, the means $ \bar{t} $ and $ \bar{y} $, and the sums of squares and products about the means,
+# $$ S_{tt} = \sum (t - \bar{t})^2 \qquad S_{ty} = \sum (t - \bar{t})(y - \bar{y}) \qquad S_{yy} = \sum (y - \bar{y})^2 $$
+# Working about the means, as in Welford's method, avoids the loss of precision of summing $ t^2 $ for large times. Two sets of statistics, from different chunks of the log or different workers, are merged exactly:
+# $$ \delta_{t} = \bar{t}_{b} - \bar{t}_{a} \qquad S_{ty} = S_{ty,a} + S_{ty,b} + \delta_{t} \delta_{y} \frac{n_{a} n_{b}}{n_{a} + n_{b}} $$
+# and the fit follows at any time from
+# $$ m = \frac{S_{ty}}{S_{tt}} \qquad c = \bar{y} - m \bar{t} \qquad \sigma^2 = \frac{S_{yy} - m S_{ty}}{n - 2} \qquad \sigma_{m}^2 = \frac{\sigma^2}{S_{tt}} \qquad \sigma_{c}^2 = \sigma^2 \left( \frac{1}{n} + \frac{\bar{t}^2}{S_{tt}} \right) $$
+# which are the same errors as the covariance matrix from `polyfit`.
+
+# In[ ]:
+
+
+# The statistics are kept in one array: n, t_mean, y_mean, S_tt, S_ty, S_yy
+def fit_state():
+    return np.zeros(6)
+
+
+# Merge two sets of statistics
+def fit_merge(a, b):
+    n_a, n_b = a[0], b[0]
+    if n_a == 0:
+        return b.copy()
+    if n_b == 0:
+        return a.copy()
+    n = n_a + n_b
+    d_t = b[1] - a[1]
+    d_y = b[2] - a[2]
+    w = n_a * n_b / n
+    return np.array([n,
+                     a[1] + d_t * n_b / n,
+                     a[2] + d_y * n_b / n,
+                     a[3] + b[3] + d_t * d_t * w,
+                     a[4] + b[4] + d_t * d_y * w,
+                     a[5] + b[5] + d_y * d_y * w])
+
+
+# Add a chunk of times t and values y to the statistics
+def fit_update(state, t, y):
+    t = np.asarray(t, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if t.size == 0:
+        return state
+    t_mean, y_mean = t.mean(), y.mean()
+    d_t, d_y = t - t_mean, y - y_mean
+    chunk = np.array([t.size, t_mean, y_mean, d_t @ d_t, d_t @ d_y, d_y @ d_y])
+    return fit_merge(state, chunk)
+
+
+# Slope, intercept, cooling constant and their errors from the statistics of ln(T) against t
+def fit_result(state):
+    n, t_mean, y_mean, S_tt, S_ty, S_yy = state
+    if n < 3:
+        raise ValueError("Need at least 3 points for the errors of a straight-line fit")
+    m = S_ty / S_tt
+    c = y_mean - m * t_mean
+    var = max(S_yy - m * S_ty, 0) / (n - 2)
+    m_err = np.sqrt(var / S_tt)
+    c_err = np.sqrt(var * (1/n + t_mean**2 / S_tt))
+    return {"m": m, "c": c, "m_err": m_err, "c_err": c_err, "k": -m, "k_err": m_err}
+
+
+# In[ ]:
+
+
+# The same fit, from the data in chunks of 3 points, merged from two halves
+first = fit_update(fit_update(fit_state(), t[:3], LnTemp[:3]), t[3:5], LnTemp[3:5])
+second = fit_update(fit_update(fit_state(), t[5:8], LnTemp[5:8]), t[8:], LnTemp[8:])
+fit = fit_result(fit_merge(first, second))
+print("Streaming fit: slope = {0:6.3e} +/- {1:6.3e}, intercept = {2:6.3f} +/- {3:6.3f}".format(fit["m"], fit["m_err"], fit["c"], fit["c_err"]))
+print("Difference from polyfit: slope {0:8.2e}, slope error {1:8.2e}".format(fit["m"] - m, fit["m_err"] - m_err))
+
+# A simulated 10 Hz log of a pot cooling for a day, read in one-minute chunks
+rng = np.random.default_rng(7)
+state = fit_state()
+for minute in range(24 * 60):
+    t_chunk = 60 * minute + np.arange(0, 60, 0.1)
+    Temp_chunk = 95 * np.exp(-8e-4 * t_chunk / 60) * (1 + 0.01 * rng.standard_normal(t_chunk.size))
+    state = fit_update(state, t_chunk, np.log(Temp_chunk))
+    if (minute + 1) % 360 == 0:
+        fit = fit_result(state)
+        print("After {0:2d} hours, {1:8.0f} points: k = {2:9.3e} +/- {3:6.1e} per second".format((minute + 1) // 60, state[0], fit["k"], fit["k_err"]))
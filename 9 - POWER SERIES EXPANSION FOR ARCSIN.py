@@ -9,32 +9,181 @@
 # This is a python programme to calculate arcsin to 12 significant digits with a function using a while loop. 
 # <br>
 # 
+# The power series for arcsin is:
+# $$ \arcsin(x) = \sum_{n=0}^{\infty} \frac {(2n)!} {4^{n} (n!)^{2} (2n + 1)} x^{2n + 1} $$
+# <br>
+# 
+# The series converges slowly as $ |x| $ approaches 1, so the argument is reduced first. For $ |x| > \frac {1}{\sqrt{2}} $ the identity
+# $$ \arcsin(x) = \frac {\pi}{2} - 2 \arcsin \left( \sqrt{\frac {1 - x}{2}} \right) $$
+# brings it below $ \frac {1}{\sqrt{2}} $, and the half-angle identity
+# $$ \arcsin(y) = 2 \arcsin \left( \frac {y} {\sqrt{2 (1 + \sqrt{1 - y^{2}})}} \right) $$
+# brings it below $ \sin(\pi / 8) \approx 0.383 $, so every value needs only a small, fixed number of terms. The sum can optionally use compensated (Kahan) summation.
+# <br>
+# 
+# The series are evaluated for whole arrays of $ x $ at once. Each element stops adding terms when its own sum has converged, and the coefficients of each series are calculated once and kept in a table, which grows when more terms are needed.
+# 
 
 # In[3]:
 
 
 # Power series expansion for arcsin
 
-def psarc(x): 
-    import numpy as np 
+import numpy as np
 
-    accuracy = 1e-12
+# Coefficients c_n of the first n terms of each series, found from the ratio of successive terms
+def arcsin_coefficients(n):
+    k = np.arange(1, n)
+    return np.cumprod(np.concatenate([[1.0], (2*k - 1)**2 / ((2*k) * (2*k + 1))]))
+
+def arctan_coefficients(n):
+    k = np.arange(n)
+    return (-1.0)**k / (2*k + 1)
+
+def sin_coefficients(n):
+    k = np.arange(1, n)
+    return np.cumprod(np.concatenate([[1.0], -1 / ((2*k) * (2*k + 1))]))
+
+def cos_coefficients(n):
+    k = np.arange(1, n)
+    return np.cumprod(np.concatenate([[1.0], -1 / ((2*k - 1) * (2*k))]))
+
+def exp_coefficients(n):
+    k = np.arange(1, n)
+    return np.cumprod(np.concatenate([[1.0], 1 / k]))
+
+
+# Each series is written as f(x) = x^q * sum(c_n * (x^p)^n), stored as (p, q, coefficient function)
+SERIES = {
+    "arcsin": (2, 1, arcsin_coefficients),
+    "arctan": (2, 1, arctan_coefficients),
+    "sin": (2, 1, sin_coefficients),
+    "cos": (2, 0, cos_coefficients),
+    "exp": (1, 0, exp_coefficients),
+}
+
+# Table of the coefficients calculated so far for each series
+SERIES_CACHE = {}
+
+
+# First n coefficients of a series, extending the table (at least doubling it) when needed
+def series_coefficients(name, n):
+    c = SERIES_CACHE.get(name)
+    if c is None or len(c) < n:
+        size = max(n, 64 if c is None else 2 * len(c))
+        c = SERIES[name][2](size)
+        SERIES_CACHE[name] = c
+    return c[:n]
 
-    # Initialise the zeroth term and the sum 
-    n = 0
-    termn = 1
-    powersum = termn
 
-    # use a while Loop to get the required accuracy 
-    while (abs(termn / powersum) > accuracy):
+# Evaluate the power series name for every element of x
+# Each element adds terms until |term / sum| <= accuracy, or max_terms is reached
+# With compensated, Kahan summation carries the rounding error of each addition forward
+# Returns the array of sums and the array of the number of terms used
+
+def power_series(name, x, accuracy=1e-12, max_terms=100000, compensated=False):
+    
+    p, q, coefficients = SERIES[name]
+    x = np.asarray(x, dtype=float)
+    xf = x.ravel()
+    total = np.zeros(len(xf))
+    terms = np.zeros(len(xf), dtype=int)
+    
+    # Zeroth term of every element; the arrays below only hold the unconverged elements
+    c = series_coefficients(name, 64)
+    active = np.arange(len(xf))
+    u = xf**p
+    power = np.ones(len(xf))
+    powersum = np.full(len(xf), c[0])
+    compensation = np.zeros(len(xf))
+    
+    n = 0
+    while len(active) and n + 1 < max_terms:
         n = n + 1
-        termn = termn * x / n 
-        powersum = powersum + termn
+        if n >= len(c):
+            c = series_coefficients(name, 2 * len(c))
+        power *= u
+        termn = c[n] * power
+        if compensated:
+            corrected = termn - compensation
+            new_sum = powersum + corrected
+            compensation = (new_sum - powersum) - corrected
+            powersum = new_sum
+        else:
+            powersum += termn
+        
+        # Store the converged elements and drop them from the arrays
+        done = np.abs(termn) <= accuracy * np.abs(powersum)
+        total[active[done]] = powersum[done]
+        terms[active[done]] = n + 1
+        keep = ~done
+        active, u, power, powersum = active[keep], u[keep], power[keep], powersum[keep]
+        compensation = compensation[keep]
+    
+    # Elements which reached max_terms
+    total[active] = powersum
+    terms[active] = n + 1
+    
+    return (total * xf**q).reshape(x.shape), terms.reshape(x.shape)
+
+
+# arcsin(x) from its power series, for a single value or an array
+# With reduce, the argument is first reduced to |z| <= sin(pi/8), where the series converges quickly
+# Returns arcsin(x) and the number of terms used
 
+def psarc(x, accuracy=1e-12, reduce=True, compensated=False):
+    
+    if not reduce:
+        return power_series("arcsin", x, accuracy, compensated=compensated)
+    
+    x = np.asarray(x, dtype=float)
+    ax = np.abs(x)
+    
+    # arcsin(x) = pi/2 - 2 arcsin(sqrt((1 - x)/2)) brings |x| > 1/sqrt(2) down to below 1/sqrt(2)
+    large = ax > np.sqrt(1/2)
+    y = np.where(large, np.sqrt((1 - ax)/2), ax)
+    
+    # arcsin(y) = 2 arcsin(y / sqrt(2 (1 + sqrt(1 - y^2)))) halves the angle again
+    z = y / np.sqrt(2 * (1 + np.sqrt(1 - y**2)))
+    powersum, n = power_series("arcsin", z, accuracy, compensated=compensated)
+    
+    arcsin_y = 2 * powersum
+    return np.sign(x) * np.where(large, np.pi/2 - 2 * arcsin_y, arcsin_y), n
+
+
+for x in [0.25, 0.95]:
+    powersum, n = psarc(x)
     print("Number of terms in power series = ", n) 
     print("Power series expansion for arcsin(x) = ", powersum) 
-    print("NumPy result for arcsin(x) = ", (x))
+    print("NumPy result for arcsin(x) = ", np.arcsin(x))
+
+
+# In[ ]:
+
+
+# One call for a million values of x
+import time
+
+x_many = np.linspace(-0.9, 0.9, 1000000)
+start = time.perf_counter()
+arcsin_many, terms_many = psarc(x_many)
+print("{0} values in {1:6.3f} s, largest error = {2:8.2e}, largest number of terms = {3}".format(
+    len(x_many), time.perf_counter() - start, np.abs(arcsin_many - np.arcsin(x_many)).max(), terms_many.max()))
+
+# The other series use the same code
+x_small = np.linspace(-0.5, 0.5, 5)
+for name, exact in [("arctan", np.arctan), ("sin", np.sin), ("cos", np.cos), ("exp", np.exp)]:
+    print("{0:>6}: largest error = {1:8.2e}".format(name, np.abs(power_series(name, x_small)[0] - exact(x_small)).max()))
+
+
+# In[ ]:
 
-psarc(0.25)
-psarc(0.95)
 
+# Number of terms needed across the whole range, with and without argument reduction
+x_range = np.linspace(-0.999999, 0.999999, 100001)
+arcsin_plain, terms_plain = psarc(x_range, reduce=False)
+arcsin_reduced, terms_reduced = psarc(x_range)
+arcsin_kahan, terms_kahan = psarc(x_range, compensated=True)
+print("Without reduction: largest number of terms = {0:6}, largest error = {1:8.2e}".format(terms_plain.max(), np.abs(arcsin_plain - np.arcsin(x_range)).max()))
+print("With reduction:    largest number of terms = {0:6}, largest error = {1:8.2e}".format(terms_reduced.max(), np.abs(arcsin_reduced - np.arcsin(x_range)).max()))
+print("With Kahan sums:   largest number of terms = {0:6}, largest error = {1:8.2e}".format(terms_kahan.max(), np.abs(arcsin_kahan - np.arcsin(x_range)).max()))
+print("psarc(1) = {0}, terms = {1}".format(*psarc(1.0)))